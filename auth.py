@@ -1,14 +1,20 @@
-import os
+import hmac
 from fastapi import HTTPException, Security
 from fastapi.security.api_key import APIKeyHeader
-from dotenv import load_dotenv
 
-load_dotenv()  # ← carga .env para leer API_KEY
+from .config import API_KEY
+
+# Preparado para multi-key en el futuro; hoy solo hay una
+_VALID_KEYS = frozenset({API_KEY} if API_KEY else set())
 
-API_KEY = os.getenv("API_KEY")
 api_key_header = APIKeyHeader(name="x-api-key", auto_error=False)
 
 def require_api_key(api_key: str = Security(api_key_header)):
-    if not api_key or api_key != API_KEY:
+    # compare_digest evita el timing leak de un != sobre strings
+    if (
+        not api_key
+        or api_key not in _VALID_KEYS
+        or not hmac.compare_digest(api_key, API_KEY)
+    ):
         raise HTTPException(status_code=401, detail="Unauthorized")
     return True
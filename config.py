@@ -0,0 +1,31 @@
+# app/config.py
+
+import os
+from dataclasses import dataclass
+
+from dotenv import load_dotenv
+
+# Única llamada a load_dotenv() de toda la app: antes cada módulo
+# (auth, database, graph_client) releía el .env del disco al importar
+load_dotenv()
+
+
+@dataclass(frozen=True)
+class Settings:
+    tenant_id: str = os.getenv("TENANT_ID")
+    client_id: str = os.getenv("CLIENT_ID")
+    client_secret: str = os.getenv("CLIENT_SECRET")
+    mailbox: str = os.getenv("MAILBOX")
+    api_key: str = os.getenv("API_KEY")
+    database_url: str = os.getenv("DATABASE_URL")
+
+
+settings = Settings()
+
+# Constantes de módulo para los consumidores existentes
+TENANT_ID = settings.tenant_id
+CLIENT_ID = settings.client_id
+CLIENT_SECRET = settings.client_secret
+MAILBOX = settings.mailbox
+API_KEY = settings.api_key
+DATABASE_URL = settings.database_url
@@ -1,19 +1,168 @@
-import os
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
-from dotenv import load_dotenv
-
-# Carga variables del archivo .env
-load_dotenv()
-
-# Lee la cadena de conexión de la BD
-DATABASE_URL = os.getenv("DATABASE_URL")
-
-# Crea el engine de SQLAlchemy
-engine = create_engine(DATABASE_URL, pool_pre_ping=True, future=True)
-
-# Crea la fábrica de sesiones
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-
-# Base para los modelos
-Base = declarative_base()
+import asyncio
+import logging
+import time
+
+from sqlalchemy import event, exc
+from sqlalchemy.ext.asyncio import (
+    async_scoped_session,
+    async_sessionmaker,
+    create_async_engine,
+)
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.orm import declarative_base
+from prometheus_client import Counter, REGISTRY
+from prometheus_client.core import GaugeMetricFamily
+
+# Lee la cadena de conexión de la BD (config.py carga el .env)
+from .config import DATABASE_URL
+
+# El timeout de checkout (pool agotado) no tiene evento propio en
+# SQLAlchemy, así que se intercepta en el pool: se cuenta y se re-lanza
+
+_pool_checkout_timeouts = Counter(
+    "sms_db_pool_checkout_timeout_total",
+    "Pool checkouts that timed out waiting for a connection",
+)
+
+
+class _MetricsAsyncQueuePool(AsyncAdaptedQueuePool):
+    def _do_get(self):
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            _pool_checkout_timeouts.inc()
+            raise
+
+
+# --------- ENGINE ASYNC ---------
+# DSN con el driver aioodbc: todo el tráfico de BD (main.py y
+# email_router) pasa por este engine.
+# Pool dimensionado explícitamente: los defaults (5 + 10 overflow) se
+# agotan en bursts, y pool_recycle evita errores por conexiones muertas
+
+ASYNC_DATABASE_URL = (
+    DATABASE_URL.replace("mssql+pyodbc", "mssql+aioodbc")
+    if DATABASE_URL
+    else DATABASE_URL
+)
+
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    pool_size=20,
+    max_overflow=10,
+    pool_timeout=30,
+    pool_recycle=3600,
+    pool_pre_ping=True,
+    poolclass=_MetricsAsyncQueuePool,
+    # array-binding de pyodbc para executemany (p.ej. /email/track_bulk)
+    fast_executemany=True,
+)
+
+AsyncSessionLocal = async_sessionmaker(
+    async_engine, expire_on_commit=False, autoflush=False
+)
+
+# Sesión con scope por task de asyncio: dentro de un request, cada
+# Depends anidado recibe la misma AsyncSession en vez de construir una
+# nueva; get_db la descarta (remove) al terminar el request
+AsyncScopedSession = async_scoped_session(
+    AsyncSessionLocal, scopefunc=asyncio.current_task
+)
+
+
+# --------- MÉTRICAS DEL POOL ---------
+# Sin esto, agotar el pool solo se ve como "QueuePool limit ... timed
+# out" en los logs; estos contadores + gauges lo hacen visible en
+# /metrics. Los eventos del engine async se cuelgan de su engine
+# síncrono interno
+
+_pool_checkouts = Counter(
+    "sms_db_pool_checkouts_total", "Connections checked out of the pool"
+)
+_pool_checkins = Counter(
+    "sms_db_pool_checkins_total", "Connections returned to the pool"
+)
+_pool_connects = Counter(
+    "sms_db_pool_connects_total", "New DB connections opened"
+)
+_pool_invalidations = Counter(
+    "sms_db_pool_invalidations_total", "Connections invalidated (dead/broken)"
+)
+
+
+@event.listens_for(async_engine.sync_engine, "checkout")
+def _on_checkout(dbapi_conn, conn_record, conn_proxy):
+    _pool_checkouts.inc()
+
+
+@event.listens_for(async_engine.sync_engine, "checkin")
+def _on_checkin(dbapi_conn, conn_record):
+    _pool_checkins.inc()
+
+
+@event.listens_for(async_engine.sync_engine, "connect")
+def _on_connect(dbapi_conn, conn_record):
+    _pool_connects.inc()
+
+
+@event.listens_for(async_engine.sync_engine, "invalidate")
+def _on_invalidate(dbapi_conn, conn_record, exception):
+    _pool_invalidations.inc()
+
+
+class _PoolCollector:
+    """Lee el estado del pool en cada scrape de Prometheus."""
+
+    def collect(self):
+        pool = async_engine.sync_engine.pool
+        yield GaugeMetricFamily(
+            "sms_db_pool_checked_out", "Connections currently in use",
+            value=pool.checkedout(),
+        )
+        yield GaugeMetricFamily(
+            "sms_db_pool_checked_in", "Idle connections in the pool",
+            value=pool.checkedin(),
+        )
+        yield GaugeMetricFamily(
+            "sms_db_pool_overflow", "Current overflow beyond pool_size",
+            value=pool.overflow(),
+        )
+        yield GaugeMetricFamily(
+            "sms_db_pool_size", "Configured pool size",
+            value=pool.size(),
+        )
+
+
+REGISTRY.register(_PoolCollector())
+
+
+# --------- LOG DE QUERIES LENTAS ---------
+# Cronometra cada statement a nivel de cursor y deja un warning cuando
+# supera el umbral: así el próximo patrón N+1 / scan accidental aparece
+# en los logs en vez de descubrirse por quejas de latencia
+
+_logger = logging.getLogger("sms.db")
+
+SLOW_QUERY_SECONDS = 0.2
+
+
+def _slow_query_events(target):
+    @event.listens_for(target, "before_cursor_execute")
+    def _sql_t0(conn, cursor, statement, parameters, context, executemany):
+        context._sms_t0 = time.perf_counter()
+
+    @event.listens_for(target, "after_cursor_execute")
+    def _sql_t1(conn, cursor, statement, parameters, context, executemany):
+        t0 = getattr(context, "_sms_t0", None)
+        if t0 is None:
+            return
+        elapsed = time.perf_counter() - t0
+        if elapsed > SLOW_QUERY_SECONDS:
+            _logger.warning("slow sql %.3fs: %s", elapsed, statement[:200])
+
+
+_slow_query_events(async_engine.sync_engine)
+
+
+# Base para los modelos
+Base = declarative_base()
@@ -1,178 +1,306 @@
-# app/email_router.py
-
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from sqlalchemy import text
-from bs4 import BeautifulSoup
-
-from .auth import require_api_key
-from .graph_client import fetch_recent_messages
-from .database import SessionLocal
-
-router = APIRouter(prefix="/email", tags=["email"])
-
-
-# --------- DB DEPENDENCY ---------
-
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-
-# --------- UTILS ---------
-
-def html_to_text(html: str) -> str:
-    """Convierte HTML a texto plano con saltos de línea razonables."""
-    if not html:
-        return ""
-    soup = BeautifulSoup(html, "html.parser")
-    return soup.get_text(separator="\n")
-
-
-# --------- 1️⃣ OBTENER CORREOS RECIENTES ---------
-
-@router.get("/recent")
-def get_recent_emails(
-    limit: int = 5,
-    api_key: str = Depends(require_api_key),
-):
-    """
-    Return last N emails from ServiceHub mailbox.
-    Each email includes an ID and plain-text body.
-
-    Fields:
-      - id: Graph message ID
-      - internetMessageId: global RFC822 ID (used for tracking / duplicates)
-      - inReplyTo: internetMessageId of the parent email (if it’s a reply)
-      - from, to, subject, bodyText
-    """
-    try:
-        raw_messages = fetch_recent_messages(top=limit)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-
-    processed = []
-    for m in raw_messages:
-        processed.append({
-            "id": m.get("id"),
-            "internetMessageId": m.get("internetMessageId"),
-            "inReplyTo": m.get("inReplyTo"),
-            "from": m.get("from"),
-            "to": m.get("to", []),
-            "subject": m.get("subject"),
-            "bodyText": html_to_text(m.get("body_html") or "")
-        })
-
-    return {"ok": True, "data": processed}
-
-
-# --------- 2️⃣ CHECK: ¿EMAIL YA FUE PROCESADO? ---------
-
-@router.get("/was_processed")
-def was_processed(
-    internetMessageId: str,
-    db: Session = Depends(get_db),
-    api_key: str = Depends(require_api_key),
-):
-    """
-    Check if an email (identified by InternetMessageID) was already processed
-    and linked to a quote.
-    """
-    sql = text("""
-        SELECT 
-            fldQuoteID    AS quoteId,
-            fldQuoteNo    AS quoteNo,
-            fldCustomerID AS customerId,
-            fldAssetID    AS assetId
-        FROM tblEmailQuoteTracking
-        WHERE InternetMessageID = :imid
-    """)
-
-    row = db.execute(sql, {"imid": internetMessageId}).mappings().first()
-
-    if row:
-        return {
-            "processed": True,
-            "quoteId": row["quoteId"],
-            "quoteNo": row["quoteNo"],
-            "customerId": row["customerId"],
-            "assetId": row["assetId"],
-        }
-
-    return {"processed": False}
-
-
-# --------- 3️⃣ TRACK: GUARDAR QUE SE PROCESÓ UN EMAIL ---------
-
-@router.post("/track")
-def track_email(
-    data: dict,
-    db: Session = Depends(get_db),
-    api_key: str = Depends(require_api_key),
-):
-    """
-    Store that an email (InternetMessageID) has been processed and
-    linked to a quote. GPT should call this AFTER a quote is created.
-
-    Expected JSON:
-    {
-      "internetMessageId": "...",   # REQUIRED
-      "forwardedEmailId": "...",    # optional
-      "subject": "...",
-      "from": "sender@domain.com",
-      "customerId": 123,
-      "assetId": 456,
-      "quoteId": 789,
-      "quoteNo": "AUK25Q419935",
-      "notes": "Created quote for ..."
-    }
-    """
-    # Validación mínima
-    if not data.get("internetMessageId"):
-        raise HTTPException(status_code=400, detail="internetMessageId is required")
-
-    sql = text("""
-        INSERT INTO tblEmailQuoteTracking
-        (
-            InternetMessageID,
-            ForwardedEmailID,
-            Subject,
-            FromAddress,
-            fldCustomerID,
-            fldAssetID,
-            fldQuoteID,
-            fldQuoteNo,
-            fldNotes
-        )
-        VALUES
-        (
-            :imid,
-            :fid,
-            :subject,
-            :fromAddr,
-            :customerId,
-            :assetId,
-            :quoteId,
-            :quoteNo,
-            :notes
-        )
-    """)
-
-    db.execute(sql, {
-        "imid": data.get("internetMessageId"),
-        "fid": data.get("forwardedEmailId"),
-        "subject": data.get("subject"),
-        "fromAddr": data.get("from"),
-        "customerId": data.get("customerId"),
-        "assetId": data.get("assetId"),
-        "quoteId": data.get("quoteId"),
-        "quoteNo": data.get("quoteNo"),
-        "notes": data.get("notes"),
-    })
-
-    db.commit()
-    return {"ok": True}
-
+# app/email_router.py
+
+import asyncio
+import re
+from typing import List
+
+from cachetools import TTLCache
+import orjson
+from prometheus_client import Counter
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+from lxml import html as lxml_html
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
+from bs4 import BeautifulSoup
+
+from .auth import require_api_key
+from .graph_client import fetch_recent_messages
+from .database import AsyncSessionLocal, async_engine
+
+router = APIRouter(prefix="/email", tags=["email"])
+
+
+# --------- SQL PRECOMPILADO ---------
+# text() se construye una sola vez al importar; así el caché de
+# statements de SQLAlchemy reutiliza la forma compilada en cada request
+
+_SQL_WAS_PROCESSED = text("""
+    SELECT
+        fldQuoteID    AS quoteId,
+        fldQuoteNo    AS quoteNo,
+        fldCustomerID AS customerId,
+        fldAssetID    AS assetId
+    FROM tblEmailQuoteTracking
+    WHERE InternetMessageID = :imid
+""")
+
+# HOLDLOCK: sin él, dos /track concurrentes del mismo mensaje pueden
+# tomar ambos la rama NOT MATCHED y uno revienta contra el índice único
+_SQL_TRACK_UPSERT = text("""
+    MERGE tblEmailQuoteTracking WITH (HOLDLOCK) AS T
+    USING (VALUES (
+        :imid, :fid, :subject, :fromAddr,
+        :customerId, :assetId, :quoteId, :quoteNo, :notes
+    )) AS S (
+        InternetMessageID, ForwardedEmailID, Subject, FromAddress,
+        fldCustomerID, fldAssetID, fldQuoteID, fldQuoteNo, fldNotes
+    )
+    ON T.InternetMessageID = S.InternetMessageID
+    WHEN MATCHED THEN UPDATE SET
+        ForwardedEmailID = S.ForwardedEmailID,
+        Subject          = S.Subject,
+        FromAddress      = S.FromAddress,
+        fldCustomerID    = S.fldCustomerID,
+        fldAssetID       = S.fldAssetID,
+        fldQuoteID       = S.fldQuoteID,
+        fldQuoteNo       = S.fldQuoteNo,
+        fldNotes         = S.fldNotes
+    WHEN NOT MATCHED THEN INSERT (
+        InternetMessageID, ForwardedEmailID, Subject, FromAddress,
+        fldCustomerID, fldAssetID, fldQuoteID, fldQuoteNo, fldNotes
+    )
+    VALUES (
+        S.InternetMessageID, S.ForwardedEmailID, S.Subject, S.FromAddress,
+        S.fldCustomerID, S.fldAssetID, S.fldQuoteID, S.fldQuoteNo, S.fldNotes
+    );
+""")
+
+
+# --------- CACHE was_processed ---------
+# GPT suele re-preguntar por el mismo internetMessageId dentro de una
+# conversación; los hits repetidos se resuelven con un lookup en memoria.
+# Los handlers son async y corren en el event loop: no hace falta lock
+
+_was_processed_cache = TTLCache(maxsize=2048, ttl=60)
+
+# Hit rate visible en /metrics: si los hits no dominan, el cache no
+# está pagando su TTL
+_was_processed_cache_hits = Counter(
+    "sms_was_processed_cache_hits_total", "was_processed cache hits"
+)
+_was_processed_cache_misses = Counter(
+    "sms_was_processed_cache_misses_total", "was_processed cache misses"
+)
+
+
+# --------- DB DEPENDENCY ---------
+
+async def get_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+async def get_conn():
+    # Conexión directa del engine para endpoints de solo lectura: se
+    # ahorra el identity-map / autoflush / BEGIN-ROLLBACK de una Session
+    async with async_engine.connect() as conn:
+        yield conn
+
+
+# --------- UTILS ---------
+
+# Por encima de este tamaño conviene saltarse BeautifulSoup y extraer
+# el texto directo con lxml (sin construir el árbol navegable de BS4)
+_LXML_THRESHOLD = 4096
+
+_BR_RE = re.compile(r"<br\s*/?>", re.IGNORECASE)
+
+
+def html_to_text(html: str) -> str:
+    """Convierte HTML a texto plano con saltos de línea razonables."""
+    if not html:
+        return ""
+    if len(html) > _LXML_THRESHOLD:
+        # text_content() ignora <br>, así que se sustituye antes
+        return lxml_html.fromstring(_BR_RE.sub("\n", html)).text_content()
+    soup = BeautifulSoup(html, "lxml")
+    return soup.get_text(separator="\n")
+
+
+# --------- 1️⃣ OBTENER CORREOS RECIENTES ---------
+
+@router.get("/recent")
+async def get_recent_emails(
+    limit: int = 5,
+    api_key: str = Depends(require_api_key),
+):
+    """
+    Return last N emails from ServiceHub mailbox.
+    Each email includes an ID and plain-text body.
+
+    Fields:
+      - id: Graph message ID
+      - internetMessageId: global RFC822 ID (used for tracking / duplicates)
+      - inReplyTo: internetMessageId of the parent email (if it’s a reply)
+      - from, to, subject, bodyText
+    """
+    try:
+        raw_messages = await fetch_recent_messages(top=limit)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    # Graph ya devuelve texto plano (header Prefer); solo se parsea si
+    # algún mensaje llegó igualmente en HTML, y en ese caso en threads
+    # para no bloquear el event loop
+    async def _body_text(m):
+        if m.get("body_type") == "html":
+            return await asyncio.to_thread(html_to_text, m.get("body") or "")
+        return m.get("body") or ""
+
+    # Streaming: cada mensaje sale al socket apenas está listo, en vez
+    # de materializar la lista completa (orjson serializa cada registro)
+    async def _emit():
+        yield b'{"ok":true,"data":['
+        for i, m in enumerate(raw_messages):
+            body_text = await _body_text(m)
+            if i:
+                yield b","
+            yield orjson.dumps({
+                "id": m.get("id"),
+                "internetMessageId": m.get("internetMessageId"),
+                "inReplyTo": m.get("inReplyTo"),
+                "from": m.get("from"),
+                "to": m.get("to", []),
+                "subject": m.get("subject"),
+                "bodyText": body_text
+            })
+        yield b"]}"
+
+    return StreamingResponse(_emit(), media_type="application/json")
+
+
+# --------- 2️⃣ CHECK: ¿EMAIL YA FUE PROCESADO? ---------
+
+@router.get("/was_processed")
+async def was_processed(
+    internetMessageId: str,
+    conn: AsyncConnection = Depends(get_conn),
+    api_key: str = Depends(require_api_key),
+):
+    """
+    Check if an email (identified by InternetMessageID) was already processed
+    and linked to a quote.
+    """
+    cached = _was_processed_cache.get(internetMessageId)
+    if cached is not None:
+        _was_processed_cache_hits.inc()
+        return cached
+    _was_processed_cache_misses.inc()
+
+    row = (await conn.execute(_SQL_WAS_PROCESSED, {"imid": internetMessageId})).mappings().first()
+
+    if row:
+        result = {
+            "processed": True,
+            "quoteId": row["quoteId"],
+            "quoteNo": row["quoteNo"],
+            "customerId": row["customerId"],
+            "assetId": row["assetId"],
+        }
+    else:
+        # También se cachea el "no encontrado" (lo invalida /track)
+        result = {"processed": False}
+
+    _was_processed_cache[internetMessageId] = result
+
+    return result
+
+
+# --------- 3️⃣ TRACK: GUARDAR QUE SE PROCESÓ UN EMAIL ---------
+
+@router.post("/track")
+async def track_email(
+    data: dict,
+    db: AsyncSession = Depends(get_db),
+    api_key: str = Depends(require_api_key),
+):
+    """
+    Store that an email (InternetMessageID) has been processed and
+    linked to a quote. GPT should call this AFTER a quote is created.
+
+    The insert is an idempotent upsert on InternetMessageID, so calling
+    /track twice (or skipping the /was_processed pre-check) is safe and
+    costs a single DB round trip.
+
+    Expected JSON:
+    {
+      "internetMessageId": "...",   # REQUIRED
+      "forwardedEmailId": "...",    # optional
+      "subject": "...",
+      "from": "sender@domain.com",
+      "customerId": 123,
+      "assetId": 456,
+      "quoteId": 789,
+      "quoteNo": "AUK25Q419935",
+      "notes": "Created quote for ..."
+    }
+    """
+    # Validación mínima
+    if not data.get("internetMessageId"):
+        raise HTTPException(status_code=400, detail="internetMessageId is required")
+
+    await db.execute(_SQL_TRACK_UPSERT, {
+        "imid": data.get("internetMessageId"),
+        "fid": data.get("forwardedEmailId"),
+        "subject": data.get("subject"),
+        "fromAddr": data.get("from"),
+        "customerId": data.get("customerId"),
+        "assetId": data.get("assetId"),
+        "quoteId": data.get("quoteId"),
+        "quoteNo": data.get("quoteNo"),
+        "notes": data.get("notes"),
+    })
+
+    await db.commit()
+
+    # Invalida el cache para que el resultado positivo sea visible ya
+    _was_processed_cache.pop(data["internetMessageId"], None)
+
+    return {"ok": True}
+
+
+# --------- 4️⃣ TRACK BULK: GUARDAR VARIOS EMAILS EN UN SOLO VIAJE ---------
+
+@router.post("/track_bulk")
+async def track_email_bulk(
+    data: List[dict],
+    db: AsyncSession = Depends(get_db),
+    api_key: str = Depends(require_api_key),
+):
+    """
+    Bulk version of /track for replays/backfills: accepts a list of the
+    same JSON objects /track takes and upserts them in a single
+    executemany + one commit, instead of one round trip per email.
+    """
+    if not data:
+        raise HTTPException(status_code=400, detail="data must be a non-empty list")
+
+    params_list = []
+    for i, row in enumerate(data):
+        if not row.get("internetMessageId"):
+            raise HTTPException(
+                status_code=400,
+                detail=f"internetMessageId is required (row {i})",
+            )
+        params_list.append({
+            "imid": row.get("internetMessageId"),
+            "fid": row.get("forwardedEmailId"),
+            "subject": row.get("subject"),
+            "fromAddr": row.get("from"),
+            "customerId": row.get("customerId"),
+            "assetId": row.get("assetId"),
+            "quoteId": row.get("quoteId"),
+            "quoteNo": row.get("quoteNo"),
+            "notes": row.get("notes"),
+        })
+
+    # Lista de dicts → executemany a nivel de driver, una sola transacción
+    await db.execute(_SQL_TRACK_UPSERT, params_list)
+    await db.commit()
+
+    for p in params_list:
+        _was_processed_cache.pop(p["imid"], None)
+
+    return {"ok": True, "tracked": len(params_list)}
+
@@ -1,97 +1,153 @@
-import os
-import msal
-import requests
-from dotenv import load_dotenv
+import asyncio
+import threading
+import time
 
-load_dotenv()
+import msal
+import httpx
+import orjson
 
-TENANT_ID = os.getenv("TENANT_ID")
-CLIENT_ID = os.getenv("CLIENT_ID")
-CLIENT_SECRET = os.getenv("CLIENT_SECRET")
-MAILBOX = os.getenv("MAILBOX")
+from .config import TENANT_ID, CLIENT_ID, CLIENT_SECRET, MAILBOX
 
 AUTHORITY = f"https://login.microsoftonline.com/{TENANT_ID}"
 SCOPE = ["https://graph.microsoft.com/.default"]
 
+GRAPH_BASE = "https://graph.microsoft.com/v1.0"
+
+# Solo los campos que email_router realmente usa.
+# Ojo: "inReplyTo" NO es una propiedad del recurso message de Graph v1.0
+# ($select con propiedades desconocidas → 400 ErrorInvalidProperty); la
+# clave se sigue emitiendo abajo con None para no romper el contrato
+MESSAGE_FIELDS = (
+    "id,internetMessageId,from,subject,body,toRecipients,ccRecipients"
+)
+
+# Cliente compartido: conexiones keep-alive + HTTP/2, se cierra en el
+# lifespan de la app (main.py)
+_client = None
+
+# Reintentos para statuses transitorios de Graph (throttling / 5xx)
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+RETRY_TOTAL = 3
+RETRY_BACKOFF = 0.3
+
+
+def get_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            base_url=GRAPH_BASE,
+            timeout=30,
+            limits=httpx.Limits(max_keepalive_connections=20),
+            # retries de transporte cubren errores de conexión;
+            # los de status los maneja _get_with_retry
+            transport=httpx.AsyncHTTPTransport(http2=True, retries=RETRY_TOTAL),
+        )
+    return _client
+
+
+async def _get_with_retry(url: str, headers: dict) -> httpx.Response:
+    """GET con backoff exponencial sobre 429/5xx, respetando Retry-After."""
+    client = get_client()
+    resp = None
+    for attempt in range(RETRY_TOTAL + 1):
+        resp = await client.get(url, headers=headers)
+        if resp.status_code not in RETRY_STATUSES or attempt == RETRY_TOTAL:
+            break
+        retry_after = resp.headers.get("Retry-After")
+        if retry_after and retry_after.isdigit():
+            delay = int(retry_after)
+        else:
+            delay = RETRY_BACKOFF * (2 ** attempt)
+        await asyncio.sleep(delay)
+    return resp
+
+
+async def close_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+# App MSAL singleton + cache del token en memoria (los tokens de Graph
+# duran ~1 hora, no hace falta pedir uno por request).
+# Se construye perezosa como _client en get_client(): el constructor de
+# MSAL hace discovery HTTP contra la authority, y eso no debe correr
+# (ni poder fallar) al importar el módulo
+_msal_app = None
+
+_token_cache = {"token": None, "exp": 0.0}
+_token_lock = threading.Lock()
+
+
+def _get_msal_app() -> msal.ConfidentialClientApplication:
+    global _msal_app
+    if _msal_app is None:
+        _msal_app = msal.ConfidentialClientApplication(
+            CLIENT_ID,
+            authority=AUTHORITY,
+            client_credential=CLIENT_SECRET
+        )
+    return _msal_app
+
 
 def get_token() -> str:
     """Authenticate using Microsoft identity platform and return an access token."""
-    app = msal.ConfidentialClientApplication(
-        CLIENT_ID,
-        authority=AUTHORITY,
-        client_credential=CLIENT_SECRET
-    )
-    result = app.acquire_token_for_client(scopes=SCOPE)
-    if "access_token" not in result:
-        raise RuntimeError(result)
-    return result["access_token"]
+    with _token_lock:
+        # Margen de 60 s para no usar un token a punto de expirar
+        if _token_cache["token"] and time.time() < _token_cache["exp"] - 60:
+            return _token_cache["token"]
+
+        result = _get_msal_app().acquire_token_for_client(scopes=SCOPE)
+        if "access_token" not in result:
+            raise RuntimeError(result)
+
+        _token_cache["token"] = result["access_token"]
+        _token_cache["exp"] = time.time() + result.get("expires_in", 3600)
+        return _token_cache["token"]
 
 
-def fetch_recent_messages(top: int = 5):
+async def fetch_recent_messages(top: int = 5):
     """Fetch the last N emails from the ServiceHub mailbox, including full body and header metadata."""
     token = get_token()
-    headers = {"Authorization": f"Bearer {token}"}
-
-    # First request: metadata only, ordered by date
+    headers = {
+        "Authorization": f"Bearer {token}",
+        # Graph convierte el cuerpo a texto plano del lado del servidor,
+        # así el router se ahorra el parseo HTML
+        "Prefer": 'outlook.body-content-type="text"',
+    }
+
+    # Una sola request: $select trae cuerpo + headers directamente,
+    # sin segundo GET (ni $batch) por mensaje
     url = (
-        f"https://graph.microsoft.com/v1.0/users/{MAILBOX}/messages"
+        f"/users/{MAILBOX}/messages"
         f"?$top={top}&$orderby=receivedDateTime desc"
+        f"&$select={MESSAGE_FIELDS}"
     )
 
-    resp = requests.get(url, headers=headers)
+    resp = await _get_with_retry(url, headers)
     resp.raise_for_status()
-    data = resp.json()
+    # orjson parsea los cuerpos grandes bastante más rápido que el json
+    # de la stdlib que usa resp.json()
+    data = orjson.loads(resp.content)
 
     messages = []
 
     for m in data.get("value", []):
-        msg_id = m["id"]
-
-        # Second request: fetch full message body + headers
-        full_url = f"https://graph.microsoft.com/v1.0/users/{MAILBOX}/messages/{msg_id}"
-        full_resp = requests.get(full_url, headers=headers)
-        full_resp.raise_for_status()
-        full = full_resp.json()
-
-        body_html = full.get("body", {}).get("content", "") or ""
+        body = m.get("body", {}) or {}
 
         messages.append({
-            "id": msg_id,
-            "internetMessageId": full.get("internetMessageId"),  # RFC822 ID
-            "inReplyTo": full.get("inReplyTo"),                  # 🔥 helps detect replies / updates
-            "from": full.get("from", {}).get("emailAddress", {}).get("address"),
-            "subject": full.get("subject"),
-            "body_html": body_html,
-            "to": [r["emailAddress"]["address"] for r in full.get("toRecipients", [])],
-            "cc": [r["emailAddress"]["address"] for r in full.get("ccRecipients", [])],
+            "id": m.get("id"),
+            "internetMessageId": m.get("internetMessageId"),  # RFC822 ID
+            "inReplyTo": None,  # Graph no expone este campo (ver MESSAGE_FIELDS)
+            "from": m.get("from", {}).get("emailAddress", {}).get("address"),
+            "subject": m.get("subject"),
+            "body": body.get("content", "") or "",
+            # normalmente "text" gracias al header Prefer
+            "body_type": (body.get("contentType") or "text").lower(),
+            "to": [r["emailAddress"]["address"] for r in m.get("toRecipients", [])],
+            "cc": [r["emailAddress"]["address"] for r in m.get("ccRecipients", [])],
         })
 
     return messages
 
-
-# -----------------------------
-# TEST BLOCK (run manually)
-# -----------------------------
-if __name__ == "__main__":
-    print("\nTesting email fetch...\n")
-
-    try:
-        msgs = fetch_recent_messages(5)
-        print(f"Fetched {len(msgs)} messages.\n")
-
-        for i, m in enumerate(msgs, start=1):
-            print(f"--- Message {i} ---")
-            print(f"ID: {m['id']}")
-            print(f"InternetMessageID: {m.get('internetMessageId')}")
-            print(f"InReplyTo: {m.get('inReplyTo')}")
-            print(f"From: {m['from']}")
-            print(f"To: {', '.join(m['to'])}")
-            print(f"Subject: {m['subject']}")
-            snippet = (m['body_html'] or "").replace("\n", " ")[:200]
-            print(f"Body snippet: {snippet!r}")
-            print()
-
-    except Exception as err:
-        print("❌ ERROR while fetching messages:")
-        print(err)
-
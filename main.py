@@ -1,38 +1,59 @@
 ﻿# app/main.py
+import asyncio
+from contextlib import asynccontextmanager
 from typing import Optional, Dict, Any, List
 
+import orjson
+from cachetools import TTLCache
 from fastapi import FastAPI, Depends, HTTPException
-from pydantic import BaseModel
-from sqlalchemy.orm import Session
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from prometheus_client import make_asgi_app
+from pydantic import BaseModel, ValidationError, conint, model_validator
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import text
 from sqlalchemy.exc import SQLAlchemyError
 
-from .database import SessionLocal
+from .database import AsyncScopedSession, AsyncSessionLocal
 from .auth import require_api_key
 
 # 👉 Importamos el nuevo router para emails
 from . import email_router
+from . import graph_client
 
 
-app = FastAPI(title="SMS API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    # Cierra el cliente HTTP compartido de Graph al apagar
+    await graph_client.close_client()
+
+
+# orjson serializa las respuestas en C; con los payloads de listas
+# grandes (assets/quotes) es varias veces más rápido que el json stdlib
+app = FastAPI(title="SMS API", lifespan=lifespan, default_response_class=ORJSONResponse)
 
 
 # --------- MODELOS ---------
 
+# IDs y límites validados en pydantic-core: un valor basura del GPT se
+# rechaza con 422 antes de llegar a SQL Server
+PositiveId = conint(ge=1)
+
+
 class QueryRequest(BaseModel):
     queryType: str
     params: Optional[Dict[str, Any]] = None
 
     # Compatibilidad cuando GPT no envía params
     name: Optional[str] = None
-    limit: Optional[int] = None
+    limit: Optional[conint(ge=1, le=500)] = None
     customerName: Optional[str] = None
     branch: Optional[str] = None
     status: Optional[str] = None
 
     # assets
-    customerId: Optional[int] = None
-    assetTypeId: Optional[int] = None
+    customerId: Optional[PositiveId] = None
+    assetTypeId: Optional[PositiveId] = None
     assetType: Optional[str] = None
     vesselName: Optional[str] = None
     country: Optional[str] = None
@@ -41,134 +62,334 @@ class QueryRequest(BaseModel):
     assetDeleted: Optional[bool] = None
 
     # creación de cotizaciones (uspCreateQuoteAPI)
-    assetId: Optional[int] = None
+    assetId: Optional[PositiveId] = None
     createdBy: Optional[str] = None
     isAlatas: Optional[bool] = None
-    relationshipId: Optional[int] = None
+    relationshipId: Optional[PositiveId] = None
     notes: Optional[str] = None
 
     # meetings
-    meetingId: Optional[int] = None
+    meetingId: Optional[PositiveId] = None
     meetingDate: Optional[str] = None  # formato 'YYYY-MM-DD'
 
     # meeting actions
     description: Optional[str] = None
-    position: Optional[int] = None
-    employeeId: Optional[int] = None
-    
+    position: Optional[PositiveId] = None
+    employeeId: Optional[PositiveId] = None
+
     # meeting topics / spec ops
     keyTopic: Optional[str] = None
     specOp: Optional[str] = None
-    
+
     # meeting attendance
-    contactId: Optional[int] = None
-    
-    
-# --------- DEPENDENCIAS ---------
+    contactId: Optional[PositiveId] = None
+
+    @model_validator(mode="after")
+    def _merge_flat_fields(self):
+        # Compatibilidad cuando GPT manda campos sueltos: se funden en
+        # params durante el propio parseo (pydantic-core), con el params
+        # explícito ganando sobre los campos planos
+        extra = self.model_dump(
+            exclude_unset=True, exclude_none=True, exclude={"queryType", "params"}
+        )
+        if extra:
+            extra.update(self.params or {})
+            self.params = extra
+        return self
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
 
+# --------- PARAMS POR queryType ---------
+# Modelos chicos por tipo de consulta: pydantic valida solo los campos
+# que ese handler usa (3-7 campos) en vez de los ~25 del mega-schema
 
-# --------- ENDPOINTS ---------
+LimitInt = conint(ge=1, le=500)
 
-@app.get("/health")
-def health():
-    return {"status": "ok"}
 
+class CustomersSearchParams(BaseModel):
+    name: Optional[str] = None
+    limit: Optional[LimitInt] = None
 
-@app.post("/api/query")
-def run_query(
-    body: QueryRequest,
-    db: Session = Depends(get_db),
-    api_key: str = Depends(require_api_key),
-):
-    qt = body.queryType
-    params: Dict[str, Any] = body.params or {}
 
-    # Compatibilidad: mover campos sueltos a params
-    for field in [
-        "name", "limit", "customerName", "branch", "status",
-        "customerId", "assetTypeId", "assetType",
-        "vesselName", "country", "interCo", "blocked", "assetDeleted",
-        # creación de cotización
-        "assetId", "createdBy", "relationshipId", "notes",
-        # meetings / actions / topics / spec ops / attendance
-        "meetingId", "meetingDate", "description", "position",
-        "employeeId", "keyTopic", "specOp", "contactId",
-    ]:
+class QuotesByCustomerParams(BaseModel):
+    customerName: Optional[str] = None
+    limit: Optional[LimitInt] = None
 
 
-        value = getattr(body, field)
-        if value is not None and field not in params:
-            params[field] = value
+class QuotesCountParams(BaseModel):
+    branch: Optional[str] = None
+    status: Optional[str] = None
 
-    # ---- CONSULTAS / OPERACIONES ----
-    if qt == "customers_search":
-        data = search_customers(db, params)
 
-    elif qt == "quotes_by_customer":
-        data = get_quotes_by_customer(db, params)
+class AssetsByCustomerParams(BaseModel):
+    customerId: Optional[PositiveId] = None
+    vesselName: Optional[str] = None
+    limit: Optional[LimitInt] = None
+    assetTypeId: Optional[PositiveId] = None
+    assetType: Optional[str] = None
+    country: Optional[str] = None
+    interCo: Optional[bool] = None
+    blocked: Optional[bool] = None
+    assetDeleted: Optional[bool] = None
 
-    elif qt == "quotes_count_by_branch_status":
-        data = get_quotes_count_by_branch_status(db, params)
 
-    elif qt == "assets_by_customer":
-        data = get_assets_by_customer(db, params)
+class AssetsSearchGlobalParams(BaseModel):
+    vesselName: Optional[str] = None
+    limit: Optional[LimitInt] = None
 
-    elif qt == "assets_search_global":
-        data = search_assets_global(db, params)
 
-    elif qt == "create_quote_from_asset":
-        data = create_quote_from_asset(db, params)
+class CreateQuoteParams(BaseModel):
+    customerId: Optional[PositiveId] = None
+    assetId: Optional[PositiveId] = None
+    branch: Optional[str] = None
+    createdBy: Optional[str] = None
+    relationshipId: Optional[PositiveId] = None
+    notes: Optional[str] = None
 
-    elif qt == "customer_contacts":
-        data = get_customer_contacts(db, params)
 
-    # -------- MEETINGS --------
-    elif qt == "meetings_by_customer":
-        data = get_meetings_by_customer(db, params)
+class CustomerContactsParams(BaseModel):
+    customerId: Optional[PositiveId] = None
+    limit: Optional[LimitInt] = None
 
-    elif qt == "meeting_key_topics":
-        data = get_meeting_key_topics(db, params)
 
-    elif qt == "meeting_spec_ops":
-        data = get_meeting_spec_ops(db, params)
+class MeetingsByCustomerParams(BaseModel):
+    customerId: Optional[PositiveId] = None
+    limit: Optional[LimitInt] = None
+    status: Optional[str] = None
 
-    elif qt == "meeting_actions":
-        data = get_meeting_actions(db, params)
 
-    elif qt == "create_meeting":
-        data = create_meeting(db, params)
+class MeetingDetailParams(BaseModel):
+    meetingId: Optional[PositiveId] = None
 
-    elif qt == "create_meeting_key_topic":
-        data = create_meeting_key_topic(db, params)
 
-    elif qt == "create_meeting_spec_op":
-        data = create_meeting_spec_op(db, params)
+class CreateMeetingParams(BaseModel):
+    customerId: Optional[PositiveId] = None
+    meetingDate: Optional[str] = None
+    createdBy: Optional[str] = None
+    status: Optional[str] = None
+    assetId: Optional[PositiveId] = None
 
-    elif qt == "create_meeting_action":
-        data = create_meeting_action(db, params)
 
-    elif qt == "create_meeting_alatas_attendance":
-        data = create_meeting_alatas_attendance(db, params)
+class CreateMeetingKeyTopicParams(BaseModel):
+    meetingId: Optional[PositiveId] = None
+    keyTopic: Optional[str] = None
+    position: Optional[PositiveId] = None
+    createdBy: Optional[str] = None
 
-    elif qt == "create_meeting_cust_attendance":
-        data = create_meeting_cust_attendance(db, params)
 
-    else:
+class CreateMeetingSpecOpParams(BaseModel):
+    meetingId: Optional[PositiveId] = None
+    specOp: Optional[str] = None
+    position: Optional[PositiveId] = None
+    createdBy: Optional[str] = None
+
+
+class CreateMeetingActionParams(BaseModel):
+    meetingId: Optional[PositiveId] = None
+    description: Optional[str] = None
+    position: Optional[PositiveId] = None
+    status: Optional[str] = None
+    branch: Optional[str] = None
+    employeeId: Optional[PositiveId] = None
+    createdBy: Optional[str] = None
+
+
+class CreateMeetingAlatasAttendanceParams(BaseModel):
+    meetingId: Optional[PositiveId] = None
+    employeeId: Optional[PositiveId] = None
+    createdBy: Optional[str] = None
+
+
+class CreateMeetingCustAttendanceParams(BaseModel):
+    meetingId: Optional[PositiveId] = None
+    contactId: Optional[PositiveId] = None
+    createdBy: Optional[str] = None
+
+
+class CustomerOverviewParams(BaseModel):
+    customerId: Optional[PositiveId] = None
+    limit: Optional[LimitInt] = None
+
+
+class CreateMeetingCustAttendanceBulkParams(BaseModel):
+    meetingId: Optional[PositiveId] = None
+    contactIds: Optional[List[PositiveId]] = None
+    createdBy: Optional[str] = None
+
+
+MODEL_FOR = {
+    "customers_search": CustomersSearchParams,
+    "quotes_by_customer": QuotesByCustomerParams,
+    "quotes_count_by_branch_status": QuotesCountParams,
+    "assets_by_customer": AssetsByCustomerParams,
+    "assets_search_global": AssetsSearchGlobalParams,
+    "create_quote_from_asset": CreateQuoteParams,
+    "customer_contacts": CustomerContactsParams,
+    "customer_overview": CustomerOverviewParams,
+    "meetings_by_customer": MeetingsByCustomerParams,
+    "meeting_key_topics": MeetingDetailParams,
+    "meeting_spec_ops": MeetingDetailParams,
+    "meeting_actions": MeetingDetailParams,
+    "create_meeting": CreateMeetingParams,
+    "create_meeting_key_topic": CreateMeetingKeyTopicParams,
+    "create_meeting_spec_op": CreateMeetingSpecOpParams,
+    "create_meeting_action": CreateMeetingActionParams,
+    "create_meeting_alatas_attendance": CreateMeetingAlatasAttendanceParams,
+    "create_meeting_cust_attendance": CreateMeetingCustAttendanceParams,
+    "create_meeting_cust_attendance_bulk": CreateMeetingCustAttendanceBulkParams,
+}
+
+
+# --------- CACHE DE LECTURAS ---------
+# Los GPT repiten las mismas consultas de contexto varias veces por
+# conversación; los queryTypes de solo lectura se sirven desde memoria
+# durante un rato en vez de volver a SQL Server.
+# (Los endpoints async corren en el event loop: no hace falta lock.)
+
+_query_cache = TTLCache(maxsize=1024, ttl=60)
+
+# Por encima de este límite los assets salen en streaming NDJSON en vez
+# de materializar la lista completa en memoria
+_ASSETS_STREAM_LIMIT = 200
+
+# quotes_count agrega sobre vwGlobalQuotes entera; payload chico, scan
+# caro. Cache propio por (branch, status) con invalidación al crear una
+# cotización — por eso este queryType NO va en el cache genérico
+_quotes_count_cache = TTLCache(maxsize=64, ttl=60)
+
+# El report data agrupa 4 SELECTs y GPT lo re-pide varias veces mientras
+# redacta el informe; TTL más largo porque un meeting ya cerrado apenas
+# cambia (los create_* de detalle lo invalidan explícitamente)
+_report_cache = TTLCache(maxsize=500, ttl=300)
+
+# Escrituras que modifican el detalle de un meeting existente: además de
+# guardar, tienen que tirar el report cacheado de ese meeting
+_MEETING_DETAIL_WRITES = frozenset({
+    "create_meeting_key_topic",
+    "create_meeting_spec_op",
+    "create_meeting_action",
+    "create_meeting_alatas_attendance",
+    "create_meeting_cust_attendance",
+    "create_meeting_cust_attendance_bulk",
+})
+
+
+def _cache_key(qt: str, params: Dict[str, Any]) -> tuple:
+    return (qt, orjson.dumps(params, option=orjson.OPT_SORT_KEYS))
+
+
+def _invalidate_meeting_caches(meeting_id) -> None:
+    """Descarta lo cacheado de un meeting tras una escritura en su detalle."""
+    if meeting_id is None:
+        return
+    _report_cache.pop(meeting_id, None)
+    for detail_qt in ("meeting_key_topics", "meeting_spec_ops", "meeting_actions"):
+        _query_cache.pop(_cache_key(detail_qt, {"meetingId": meeting_id}), None)
+
+
+# Listados cacheados cuyo contenido depende del customerId
+_CUSTOMER_LIST_QUERIES = frozenset({"meetings_by_customer", "customer_overview"})
+
+
+def _invalidate_customer_caches(customer_id) -> None:
+    """Descarta los listados cacheados de un cliente tras crear un meeting.
+
+    Las claves incluyen limit/status, así que no se pueden reconstruir
+    una a una: se recorre el cache (chico, máx. 1024 entradas) y se
+    tiran las que compartan el customerId mutado.
+    """
+    if customer_id is None:
+        return
+    for key in list(_query_cache):
+        qt, blob = key
+        if qt in _CUSTOMER_LIST_QUERIES and orjson.loads(blob).get("customerId") == customer_id:
+            _query_cache.pop(key, None)
+
+
+# --------- DEPENDENCIAS ---------
+
+async def get_db():
+    # Sesión con scope por task: todos los Depends del request comparten
+    # la misma AsyncSession. El remove() va en el teardown del dependency
+    # (mismo task que el handler) y no en un middleware, porque
+    # BaseHTTPMiddleware corre el endpoint en un task distinto y el
+    # scope por task no coincidiría
+    try:
+        yield AsyncScopedSession()
+    finally:
+        await AsyncScopedSession.remove()
+
+
+# --------- ENDPOINTS ---------
+
+# Respuesta precalculada: los probes de los load balancers pegan aquí
+# constantemente y no hace falta re-serializar el mismo dict cada vez
+_HEALTH = ORJSONResponse({"status": "ok"})
+
+
+@app.get("/health", include_in_schema=False)
+def health():
+    return _HEALTH
+
+
+@app.post("/api/query")
+async def run_query(
+    body: QueryRequest,
+    db: AsyncSession = Depends(get_db),
+    api_key: str = Depends(require_api_key),
+):
+    qt = body.queryType
+    # Los campos sueltos ya vienen fundidos en params por el
+    # model_validator de QueryRequest
+    params: Dict[str, Any] = body.params or {}
+
+    # ---- CONSULTAS / OPERACIONES ----
+    entry = HANDLERS.get(qt)
+    if entry is None:
         raise HTTPException(status_code=400, detail="queryType no soportado")
+    handler, cacheable = entry
+
+    # Valida solo los campos que usa este queryType
+    model = MODEL_FOR.get(qt)
+    if model is not None:
+        try:
+            params = model(**params).model_dump(exclude_none=True)
+        except ValidationError as e:
+            raise HTTPException(status_code=422, detail=e.errors())
+
+    # Listados grandes de assets → NDJSON en streaming: se valida lo
+    # obligatorio aquí (el generador ya no puede levantar un 400 limpio
+    # una vez que la respuesta empezó a salir)
+    if qt == "assets_by_customer" and int(params.get("limit", 50)) > _ASSETS_STREAM_LIMIT:
+        if not params.get("customerId") and not params.get("vesselName"):
+            raise HTTPException(
+                status_code=400, detail="Debes enviar customerId o vesselName"
+            )
+        return StreamingResponse(
+            _stream_assets_ndjson(params), media_type="application/x-ndjson"
+        )
+
+    if cacheable:
+        key = _cache_key(qt, params)
+        cached = _query_cache.get(key)
+        if cached is not None:
+            return {"ok": True, "data": cached}
+
+    data = await handler(db, params)
+
+    if cacheable:
+        _query_cache[key] = data
+    elif qt in _MEETING_DETAIL_WRITES:
+        _invalidate_meeting_caches(params.get("meetingId"))
+    elif qt == "create_meeting":
+        # El flujo crear-y-listar de GPT no debe ver la lista vieja
+        _invalidate_customer_caches(params.get("customerId"))
 
     return {"ok": True, "data": data}
 
 @app.get("/meeting/report_data")
-def meeting_report_data(
+async def meeting_report_data(
     meetingId: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     api_key: str = Depends(require_api_key),
 ):
     """
@@ -186,214 +407,544 @@ def meeting_report_data(
       }
     }
     """
-    data = get_meeting_report_data(db, meetingId)
+    cached = _report_cache.get(meetingId)
+    if cached is not None:
+        return {"ok": True, "data": cached}
+
+    data = await get_meeting_report_data(db, meetingId)
+    _report_cache[meetingId] = data
     return {"ok": True, "data": data}
 
 
 # --------- CONSULTAS SQL ---------
+# Los text() estáticos se construyen una sola vez al importar, con el
+# límite parametrizado como TOP (:lim): un solo texto de statement →
+# un solo plan cacheado en SQL Server, sin re-parseo por request
+
+_SQL_CUSTOMERS_SEARCH = text("""
+    SELECT TOP (:lim)
+           fldCustomerID AS id,
+           fldCustomerName AS name,
+           fldEmail AS email
+    FROM tblCustomer
+    ORDER BY fldCustomerID DESC
+""")
+
+_SQL_CUSTOMERS_SEARCH_BY_NAME = text("""
+    SELECT TOP (:lim)
+           fldCustomerID AS id,
+           fldCustomerName AS name,
+           fldEmail AS email
+    FROM tblCustomer
+    WHERE fldCustomerName LIKE :name
+    ORDER BY fldCustomerID DESC
+""")
+
+_SQL_QUOTES_BY_CUSTOMER = text("""
+    SELECT TOP (:lim)
+           fldQuoteID AS id,
+           fldQuoteNo AS quoteNumber,
+           Branch AS branch,
+           fldQCreatedDate AS createdOn,
+           fldUSDValue AS totalAmount,
+           fldCustomerName AS customerName,
+           fldQStatus AS quoteStatus
+    FROM vwGlobalQuotes
+    WHERE fldCustomerName LIKE :c
+    ORDER BY fldQCreatedDate DESC
+""")
+
+_SQL_MEETINGS_BY_CUSTOMER = text("""
+    SELECT TOP (:lim)
+           fldCustMeetingID   AS meetingId,
+           fldCustomerID      AS customerId,
+           fldCustMeetingDate AS meetingDate,
+           fldCreatedBy       AS createdBy,
+           fldCreatedOn       AS createdOn,
+           fldStatus          AS status,
+           fldReportSentOn    AS reportSentOn,
+           fldAssetID         AS assetId
+    FROM tblCustMeeting
+    WHERE fldCustomerID = :cid
+    ORDER BY fldCustMeetingDate DESC, fldCustMeetingID DESC
+""")
+
+_SQL_MEETINGS_BY_CUSTOMER_STATUS = text("""
+    SELECT TOP (:lim)
+           fldCustMeetingID   AS meetingId,
+           fldCustomerID      AS customerId,
+           fldCustMeetingDate AS meetingDate,
+           fldCreatedBy       AS createdBy,
+           fldCreatedOn       AS createdOn,
+           fldStatus          AS status,
+           fldReportSentOn    AS reportSentOn,
+           fldAssetID         AS assetId
+    FROM tblCustMeeting
+    WHERE fldCustomerID = :cid AND fldStatus = :status
+    ORDER BY fldCustMeetingDate DESC, fldCustMeetingID DESC
+""")
+
+# Un solo statement estático para assets_by_customer: cada filtro
+# opcional es (:p IS NULL OR col = :p) y el match exacto de nombre va en
+# la misma query que el LIKE, con el ORDER BY CASE poniéndolo primero.
+# Los filtros por cliente/nombre asumen el índice de migrations/002
+_SQL_ASSETS_BY_CUSTOMER = text("""
+    SELECT TOP (:lim)
+           fldAssetID AS assetId,
+           fldAssetIdentifier AS assetIdentifier,
+           fldAssetType AS assetType,
+           fldAssetTypeID AS assetTypeId,
+           fldParentAssetID AS parentAssetId,
+           fldCustomerID AS customerId,
+           fldCustomerName AS customerName,
+           fldVName AS vesselName,
+           Address AS address,
+           Port AS port,
+           Terminal AS terminal,
+           PortofTerminal AS portOfTerminal,
+           ParentPort AS parentPort,
+           fldCountry AS country,
+           fldCustType AS customerType,
+           fldInterCo AS interCompanyFlag,
+           fldBlocked AS blocked,
+           fldDeleted AS customerDeleted,
+           AssetDeleted AS assetDeleted
+    FROM vwCustomerAssetAffiliation
+    WHERE (:cid IS NULL OR fldCustomerID = :cid)
+      AND (:exact_name IS NULL OR fldVName = :exact_name OR fldVName LIKE :vname)
+      AND (:assetTypeId IS NULL OR fldAssetTypeID = :assetTypeId)
+      AND (:assetType IS NULL OR fldAssetType LIKE :assetType)
+      AND (:country IS NULL OR fldCountry = :country)
+      AND (:interCo IS NULL OR fldInterCo = :interCo)
+      AND (:blocked IS NULL OR fldBlocked = :blocked)
+      AND (:assetDeleted IS NULL OR AssetDeleted = :assetDeleted)
+    ORDER BY CASE WHEN :exact_name IS NOT NULL AND fldVName = :exact_name
+                  THEN 0 ELSE 1 END,
+             fldAssetID DESC
+""")
+
+_SQL_ASSETS_BY_CUSTOMER_STREAM = _SQL_ASSETS_BY_CUSTOMER.execution_options(
+    yield_per=200
+)
+
+_SQL_ASSETS_SEARCH_GLOBAL = text("""
+    SELECT TOP (:lim)
+           fldAssetID         AS assetId,
+           fldAssetIdentifier AS assetIdentifier,
+           fldAssetType       AS assetType,
+           fldAssetTypeID     AS assetTypeId,
+           fldParentAssetID   AS parentAssetId,
+           fldCustomerID      AS customerId,
+           fldCustomerName    AS customerName,
+           fldVName           AS vesselName,
+           Address            AS address,
+           Port               AS port,
+           Terminal           AS terminal,
+           PortofTerminal     AS portOfTerminal,
+           ParentPort         AS parentPort,
+           fldCountry         AS country,
+           fldCustType        AS customerType,
+           fldInterCo         AS interCompanyFlag,
+           fldBlocked         AS blocked,
+           fldDeleted         AS customerDeleted,
+           AssetDeleted       AS assetDeleted
+    FROM vwCustomerAssetAffiliation
+    WHERE fldVName LIKE :vesselName
+    ORDER BY fldAssetID DESC
+""")
+
+_SQL_CUSTOMER_HEADER = text("""
+    SELECT fldCustomerID AS id,
+           fldCustomerName AS name,
+           fldEmail AS email
+    FROM tblCustomer
+    WHERE fldCustomerID = :cid
+""")
+
+_SQL_CUSTOMER_CONTACTS = text("""
+    SELECT TOP (:lim)
+           fldCustContactID     AS contactId,
+           fldCJobTitle         AS jobTitle,
+           fldFullName          AS fullName,
+           fldEmail             AS email,
+           fldMobileNo          AS mobileNo,
+           fldPhoneNo           AS phoneNo,
+           fldContactSalutation AS salutation,
+           fldBody              AS body,
+           fldBodyEnd           AS bodyEnd,
+           fldContCreatedDate   AS createdOn,
+           fldContCreatedBy     AS createdBy,
+           fldCustomerID        AS customerId
+    FROM vwCustContact
+    WHERE fldCustomerID = :cid
+    ORDER BY fldFullName
+""")
+
+# Asume el índice cubriente de migrations/002 (Branch + fldQStatus):
+# sin él, el COUNT/SUM escanea la vista entera
+_SQL_QUOTES_COUNT = text("""
+    SELECT
+        :branch AS branch,
+        :status AS status,
+        COUNT(*) AS quotesCount,
+        COALESCE(SUM(fldUSDValue), 0) AS totalAmount
+    FROM vwGlobalQuotes
+    WHERE Branch = :branch AND fldQStatus = :status
+""")
+
+_SQL_MEETING_KEY_TOPICS = text("""
+    SELECT fldCustMeetingKeyTopicID,
+           fldCustMeetingID,
+           fldCustMeetingKeyTopic,
+           fldCustMeetingKeyTopicPos,
+           fldCreatedOn,
+           fldCreatedBy
+    FROM tblCustMeetingKeyTopic
+    WHERE fldCustMeetingID = :mid
+    ORDER BY fldCustMeetingKeyTopicID
+""")
+
+_SQL_MEETING_SPEC_OPS = text("""
+    SELECT fldCustMeetingSpecOpID,
+           fldCustMeetingID,
+           fldCustMeetingSpecOp,
+           fldCustMeetingSpecOpPos,
+           fldCreatedBy,
+           fldCreatedOn
+    FROM tblCustMeetingSpecOp
+    WHERE fldCustMeetingID = :mid
+    ORDER BY fldCustMeetingSpecOpID
+""")
+
+# La vista concatena los responsables y su forma puede cambiar del lado
+# de la BD; aquí el SELECT * se queda a propósito
+_SQL_MEETING_ACTIONS = text("""
+    SELECT *
+    FROM vwCustMeetingActionRespConcat
+    WHERE fldCustMeetingID = :mid
+""")
+
+_SQL_MEETING_REPORT_HEADER = text("""
+    SELECT TOP (1)
+           m.fldCustMeetingID   AS meetingId,
+           m.fldCustomerID      AS customerId,
+           c.fldCustomerName    AS customerName,
+           m.fldCustMeetingDate AS meetingDate,
+           m.fldCreatedBy       AS createdBy,
+           m.fldCreatedOn       AS createdOn,
+           m.fldStatus          AS status,
+           m.fldReportSentOn    AS reportSentOn,
+           m.fldAssetID         AS assetId,
+           a.fldVName           AS vesselName,
+           a.fldAssetIdentifier AS assetIdentifier,
+           a.fldAssetType       AS assetType
+    FROM tblCustMeeting m
+    LEFT JOIN tblCustomer c
+           ON c.fldCustomerID = m.fldCustomerID
+    LEFT JOIN vwCustomerAssetAffiliation a
+           ON a.fldAssetID = m.fldAssetID
+    WHERE m.fldCustMeetingID = :mid
+""")
+
+
+# Los INSERT de los create_* también se hoistean: con un único objeto
+# text() por statement, el caché de compilación de SQLAlchemy sirve la
+# misma forma ejecutable en cada escritura
+
+_SQL_CREATE_MEETING = text("""
+    INSERT INTO tblCustMeeting (
+        fldCustomerID,
+        fldCustMeetingDate,
+        fldCreatedBy,
+        fldCreatedOn,
+        fldStatus,
+        fldAssetID
+    )
+    OUTPUT INSERTED.fldCustMeetingID
+    VALUES (
+        :customer_id,
+        :meeting_date,
+        :created_by,
+        GETDATE(),
+        :status,
+        :asset_id
+    );
+""")
+
+_SQL_CREATE_KEY_TOPIC = text("""
+    INSERT INTO tblCustMeetingKeyTopic (
+        fldCustMeetingID,
+        fldCustMeetingKeyTopic,
+        fldCustMeetingKeyTopicPos,
+        fldCreatedOn,
+        fldCreatedBy
+    )
+    OUTPUT INSERTED.fldCustMeetingKeyTopicID
+    VALUES (
+        :meeting_id,
+        :key_topic,
+        :position,
+        GETDATE(),
+        :created_by
+    );
+""")
+
+_SQL_CREATE_SPEC_OP = text("""
+    INSERT INTO tblCustMeetingSpecOp (
+        fldCustMeetingID,
+        fldCustMeetingSpecOp,
+        fldCustMeetingSpecOpPos,
+        fldCreatedBy,
+        fldCreatedOn
+    )
+    OUTPUT INSERTED.fldCustMeetingSpecOpID
+    VALUES (
+        :meeting_id,
+        :spec_op,
+        :position,
+        :created_by,
+        GETDATE()
+    );
+""")
+
+_SQL_CREATE_ACTION = text("""
+    SET NOCOUNT ON;
+
+    DECLARE @action_ids TABLE (id INT);
+    DECLARE @resp_id INT = NULL;
+
+    INSERT INTO tblCustMeetingAction (
+        fldCustMeetingID,
+        fldCustMeetingAction,
+        fldCustMeetingActionPos,
+        fldCreatedBy,
+        fldCreatedOn,
+        fldStatus
+    )
+    OUTPUT INSERTED.fldCustMeetingActionID INTO @action_ids
+    VALUES (
+        :meeting_id,
+        :description,
+        :position,
+        :created_by,
+        GETDATE(),
+        :status
+    );
+
+    DECLARE @action_id INT = (SELECT TOP (1) id FROM @action_ids);
+
+    IF :with_resp = 1
+    BEGIN
+        DECLARE @resp_ids TABLE (id INT);
+
+        INSERT INTO tblCustMeetingActionResp (
+            fldCustMeetingActionID,
+            fldBranch,
+            fldEmployeeID,
+            fldCreatedBy,
+            fldCreatedOn,
+            fldEmployeeID_B4Merging
+        )
+        OUTPUT INSERTED.fldCustMeetingActionRespID INTO @resp_ids
+        VALUES (
+            @action_id,
+            :branch,
+            :employee_id,
+            :created_by,
+            GETDATE(),
+            :employee_id_b4
+        );
+
+        SET @resp_id = (SELECT TOP (1) id FROM @resp_ids);
+    END
+
+    SELECT @action_id AS NewActionID, @resp_id AS NewRespID;
+""")
 
-def search_customers(db: Session, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+_SQL_CREATE_ALATAS_ATTENDANCE = text("""
+    INSERT INTO tblCustMeetingAlatasAttendance (
+        fldCustMeetingID,
+        fldEmployeeID,
+        fldCreatedOn,
+        fldCreatedBy,
+        fldEmployeeID_B4Merging
+    )
+    OUTPUT INSERTED.fldCustMeetingAlatasAttendanceID
+    VALUES (
+        :meeting_id,
+        :employee_id,
+        GETDATE(),
+        :created_by,
+        :employee_id_b4
+    );
+""")
+
+_SQL_CREATE_CUST_ATTENDANCE = text("""
+    INSERT INTO tblCustMeetingAttendance (
+        fldCustMeetingID,
+        fldCustContactID,
+        fldCreatedOn,
+        fldCreatedBy
+    )
+    OUTPUT INSERTED.fldCustMeetingAttendanceID
+    VALUES (
+        :meeting_id,
+        :contact_id,
+        GETDATE(),
+        :created_by
+    );
+""")
+
+# Variante executemany del insert de asistentes: sin OUTPUT, porque
+# pyodbc no devuelve filas en modo array-binding
+_SQL_CREATE_CUST_ATTENDANCE_BULK = text("""
+    INSERT INTO tblCustMeetingAttendance (
+        fldCustMeetingID,
+        fldCustContactID,
+        fldCreatedOn,
+        fldCreatedBy
+    )
+    VALUES (
+        :meeting_id,
+        :contact_id,
+        GETDATE(),
+        :created_by
+    );
+""")
+
+_SQL_CREATE_QUOTE = text("""
+    DECLARE @NewQuoteID INT, @NewQuoteNo NVARCHAR(50);
+
+    EXEC dbo.uspCreateQuoteAPI
+        @CustomerID     = :customer_id,
+        @AssetID        = :asset_id,
+        @Branch         = :branch,
+        @CreatedBy      = :created_by,
+        @RelationshipID = :relationship_id,
+        @Notes          = :notes,
+        @NewQuoteID     = @NewQuoteID OUTPUT,
+        @NewQuoteNo     = @NewQuoteNo OUTPUT;
+
+    SELECT @NewQuoteID AS NewQuoteID, @NewQuoteNo AS NewQuoteNo;
+""")
+
+
+async def search_customers(db: AsyncSession, params: Dict[str, Any]) -> List[Dict[str, Any]]:
     name = params.get("name")
     limit = int(params.get("limit", 20))
 
-    sql = f"""
-        SELECT TOP ({limit})
-               fldCustomerID AS id,
-               fldCustomerName AS name,
-               fldEmail AS email
-        FROM tblCustomer
-        WHERE 1 = 1
-    """
-
-    sql_params: Dict[str, Any] = {}
     if name:
-        sql += " AND fldCustomerName LIKE :name"
-        sql_params["name"] = f"%{name}%"
-
-    sql += " ORDER BY fldCustomerID DESC"
+        sql = _SQL_CUSTOMERS_SEARCH_BY_NAME
+        sql_params = {"lim": limit, "name": f"%{name}%"}
+    else:
+        sql = _SQL_CUSTOMERS_SEARCH
+        sql_params = {"lim": limit}
 
-    rows = db.execute(text(sql), sql_params).mappings().all()
-    return [dict(r) for r in rows]
+    # RowMapping ya es dict-like: se devuelve tal cual, sin copiar fila
+    # a fila (el encoder de FastAPI lo serializa directo)
+    rows = (await db.execute(sql, sql_params)).mappings().all()
+    return rows
 
 
-def get_quotes_by_customer(db: Session, params: Dict[str, Any]):
+async def get_quotes_by_customer(db: AsyncSession, params: Dict[str, Any]):
     customer_name = params.get("customerName")
     if not customer_name:
         raise HTTPException(status_code=400, detail="customerName es obligatorio")
 
     limit = int(params.get("limit", 20))
 
-    sql = f"""
-        SELECT TOP ({limit})
-               fldQuoteID AS id,
-               fldQuoteNo AS quoteNumber,
-               Branch AS branch,
-               fldQCreatedDate AS createdOn,
-               fldUSDValue AS totalAmount,
-               fldCustomerName AS customerName,
-               fldQStatus AS quoteStatus
-        FROM vwGlobalQuotes
-        WHERE fldCustomerName LIKE :c
-        ORDER BY fldQCreatedDate DESC
-    """
-
-    rows = db.execute(
-        text(sql),
-        {"c": f"%{customer_name}%"},
-    ).mappings().all()
+    rows = (await db.execute(
+        _SQL_QUOTES_BY_CUSTOMER,
+        {"lim": limit, "c": f"%{customer_name}%"},
+    )).mappings().all()
 
-    return [dict(r) for r in rows]
+    return rows
 
 
-def get_quotes_count_by_branch_status(db: Session, params: Dict[str, Any]):
+async def get_quotes_count_by_branch_status(db: AsyncSession, params: Dict[str, Any]):
     branch = params.get("branch")
     status = params.get("status")
 
     if not branch or not status:
         raise HTTPException(status_code=400, detail="branch y status son obligatorios")
 
-    sql = """
-        SELECT
-            :branch AS branch,
-            :status AS status,
-            COUNT(*) AS quotesCount,
-            COALESCE(SUM(fldUSDValue), 0) AS totalAmount
-        FROM vwGlobalQuotes
-        WHERE Branch = :branch AND fldQStatus = :status
-    """
+    cached = _quotes_count_cache.get((branch, status))
+    if cached is not None:
+        return cached
 
-    row = db.execute(
-        text(sql),
+    row = (await db.execute(
+        _SQL_QUOTES_COUNT,
         {"branch": branch, "status": status},
-    ).mappings().first()
+    )).mappings().first()
 
-    return (
-        [dict(row)]
+    # RowMapping es dict-like: se devuelve sin copiar
+    result = (
+        [row]
         if row
         else [{"branch": branch, "status": status, "quotesCount": 0, "totalAmount": 0}]
     )
+    _quotes_count_cache[(branch, status)] = result
+    return result
 
 
 # --------- ASSETS ---------
 
-def get_assets_by_customer(db: Session, params: Dict[str, Any]):
-    limit = int(params.get("limit", 50))
-    customer_id = params.get("customerId")
+def _assets_bind_params(params: Dict[str, Any]) -> Dict[str, Any]:
+    """Arma los binds de _SQL_ASSETS_BY_CUSTOMER (None = filtro apagado)."""
     vessel_name = params.get("vesselName")
 
+    def _flag(name):
+        value = params.get(name)
+        if value is None:
+            return None
+        return 1 if value else 0
+
+    return {
+        "lim": int(params.get("limit", 50)),
+        "cid": params.get("customerId"),
+        "exact_name": vessel_name,
+        "vname": f"%{vessel_name}%" if vessel_name else None,
+        "assetTypeId": params.get("assetTypeId"),
+        "assetType": f"%{params['assetType']}%" if params.get("assetType") else None,
+        "country": params.get("country") or None,
+        "interCo": _flag("interCo"),
+        "blocked": _flag("blocked"),
+        "assetDeleted": _flag("assetDeleted"),
+    }
+
+
+async def get_assets_by_customer(db: AsyncSession, params: Dict[str, Any]):
     # Requerimos al menos UNO
-    if not customer_id and not vessel_name:
+    if not params.get("customerId") and not params.get("vesselName"):
         raise HTTPException(
             status_code=400, detail="Debes enviar customerId o vesselName"
         )
 
-    # 1️⃣ MATCH EXACTO
-    if vessel_name:
-        exact_sql = f"""
-            SELECT TOP ({limit})
-                   fldAssetID AS assetId,
-                   fldAssetIdentifier AS assetIdentifier,
-                   fldAssetType AS assetType,
-                   fldAssetTypeID AS assetTypeId,
-                   fldParentAssetID AS parentAssetId,
-                   fldCustomerID AS customerId,
-                   fldCustomerName AS customerName,
-                   fldVName AS vesselName,
-                   Address AS address,
-                   Port AS port,
-                   Terminal AS terminal,
-                   PortofTerminal AS portOfTerminal,
-                   ParentPort AS parentPort,
-                   fldCountry AS country,
-                   fldCustType AS customerType,
-                   fldInterCo AS interCompanyFlag,
-                   fldBlocked AS blocked,
-                   fldDeleted AS customerDeleted,
-                   AssetDeleted AS assetDeleted
-            FROM vwCustomerAssetAffiliation
-            WHERE fldVName = :exact_name
-        """
-
-        sql_params: Dict[str, Any] = {"exact_name": vessel_name}
-        if customer_id:
-            exact_sql += " AND fldCustomerID = :cid"
-            sql_params["cid"] = customer_id
-
-        rows = db.execute(text(exact_sql), sql_params).mappings().all()
-        if rows:
-            return [dict(r) for r in rows]
-
-    # 2️⃣ MATCH LIKE
-    sql = f"""
-        SELECT TOP ({limit})
-               fldAssetID AS assetId,
-               fldAssetIdentifier AS assetIdentifier,
-               fldAssetType AS assetType,
-               fldAssetTypeID AS assetTypeId,
-               fldParentAssetID AS parentAssetId,
-               fldCustomerID AS customerId,
-               fldCustomerName AS customerName,
-               fldVName AS vesselName,
-               Address AS address,
-               Port AS port,
-               Terminal AS terminal,
-               PortofTerminal AS portOfTerminal,
-               ParentPort AS parentPort,
-               fldCountry AS country,
-               fldCustType AS customerType,
-               fldInterCo AS interCompanyFlag,
-               fldBlocked AS blocked,
-               fldDeleted AS customerDeleted,
-               AssetDeleted AS assetDeleted
-        FROM vwCustomerAssetAffiliation
-        WHERE 1 = 1
-    """
-
-    sql_params2: Dict[str, Any] = {}
-
-    if customer_id:
-        sql += " AND fldCustomerID = :cid"
-        sql_params2["cid"] = customer_id
-
-    if vessel_name:
-        sql += " AND fldVName LIKE :vesselName"
-        sql_params2["vesselName"] = f"%{vessel_name}%"
-
-    # Filters
-# Filters
-    if params.get("assetTypeId") is not None:
-        sql += " AND fldAssetTypeID = :assetTypeId"
-        sql_params2["assetTypeId"] = params["assetTypeId"]
+    # Todos los filtros se bindean siempre (None cuando no aplican): un
+    # único texto de statement para las 2^7 combinaciones de filtros →
+    # un solo plan cacheado en SQL Server
+    rows = (await db.execute(
+        _SQL_ASSETS_BY_CUSTOMER, _assets_bind_params(params)
+    )).mappings().all()
+    return rows
 
-    if params.get("assetType"):
-        sql += " AND fldAssetType LIKE :assetType"
-        sql_params2["assetType"] = f"%{params['assetType']}%"
 
-    if params.get("country"):
-        sql += " AND fldCountry = :country"
-        sql_params2["country"] = params["country"]
+async def _stream_assets_ndjson(params: Dict[str, Any]):
+    """Emite los assets como NDJSON fila a fila, sin materializar la lista.
 
-    if params.get("interCo") is not None:
-        sql += " AND fldInterCo = :interCo"
-        sql_params2["interCo"] = 1 if params["interCo"] else 0
-
-    if params.get("blocked") is not None:
-        sql += " AND fldBlocked = :blocked"
-        sql_params2["blocked"] = 1 if params["blocked"] else 0
-
-    if params.get("assetDeleted") is not None:
-        sql += " AND AssetDeleted = :assetDeleted"
-        sql_params2["assetDeleted"] = 1 if params["assetDeleted"] else 0
-
-    sql += " ORDER BY fldAssetID DESC"
-
-    rows = db.execute(text(sql), sql_params2).mappings().all()
-    return [dict(r) for r in rows]
+    Abre su propia sesión (el generador sigue vivo después de que el
+    dependency del request se cierra) y usa yield_per para que el driver
+    traiga los rows en tandas mientras el socket ya va enviando.
+    """
+    async with AsyncSessionLocal() as db:
+        result = await db.stream(_SQL_ASSETS_BY_CUSTOMER_STREAM, _assets_bind_params(params))
+        async for row in result.mappings():
+            yield orjson.dumps(dict(row), default=str) + b"\n"
 
 
 # --------- ASSETS ---------
 
-def search_assets_global(db: Session, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+async def search_assets_global(db: AsyncSession, params: Dict[str, Any]) -> List[Dict[str, Any]]:
     """
     Global asset search, NOT restricted to a specific customer.
     Used when GPT finds a vessel/asset name in an email but there is
@@ -409,43 +960,17 @@ def search_assets_global(db: Session, params: Dict[str, Any]) -> List[Dict[str,
             detail="You must send vesselName to search global assets"
         )
 
-    sql = f"""
-        SELECT TOP ({limit})
-               fldAssetID         AS assetId,
-               fldAssetIdentifier AS assetIdentifier,
-               fldAssetType       AS assetType,
-               fldAssetTypeID     AS assetTypeId,
-               fldParentAssetID   AS parentAssetId,
-               fldCustomerID      AS customerId,
-               fldCustomerName    AS customerName,
-               fldVName           AS vesselName,
-               Address            AS address,
-               Port               AS port,
-               Terminal           AS terminal,
-               PortofTerminal     AS portOfTerminal,
-               ParentPort         AS parentPort,
-               fldCountry         AS country,
-               fldCustType        AS customerType,
-               fldInterCo         AS interCompanyFlag,
-               fldBlocked         AS blocked,
-               fldDeleted         AS customerDeleted,
-               AssetDeleted       AS assetDeleted
-        FROM vwCustomerAssetAffiliation
-        WHERE fldVName LIKE :vesselName
-        ORDER BY fldAssetID DESC
-    """
-
-    rows = db.execute(
-        text(sql),
-        {"vesselName": f"%{vessel_name}%"},
-    ).mappings().all()
+    rows = (await db.execute(
+        _SQL_ASSETS_SEARCH_GLOBAL,
+        {"lim": limit, "vesselName": f"%{vessel_name}%"},
+    )).mappings().all()
 
-    return [dict(r) for r in rows]
+    return rows
 
 
 # --------- CONTACTOS POR CLIENTE ---------
 
-def get_customer_contacts(db: Session, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+async def get_customer_contacts(db: AsyncSession, params: Dict[str, Any]) -> List[Dict[str, Any]]:
     customer_id = params.get("customerId")
     if not customer_id:
         raise HTTPException(
@@ -455,38 +980,59 @@ def get_customer_contacts(db: Session, params: Dict[str, Any]) -> List[Dict[str,
 
     limit = int(params.get("limit", 50))
 
-    sql = f"""
-        SELECT TOP ({limit})
-               fldCustContactID     AS contactId,
-               fldCJobTitle         AS jobTitle,
-               fldFullName          AS fullName,
-               fldEmail             AS email,
-               fldMobileNo          AS mobileNo,
-               fldPhoneNo           AS phoneNo,
-               fldContactSalutation AS salutation,
-               fldBody              AS body,
-               fldBodyEnd           AS bodyEnd,
-               fldContCreatedDate   AS createdOn,
-               fldContCreatedBy     AS createdBy,
-               fldCustomerID        AS customerId
-        FROM vwCustContact
-        WHERE fldCustomerID = :cid
-        ORDER BY fldFullName
+    rows = (await db.execute(
+        _SQL_CUSTOMER_CONTACTS,
+        {"lim": limit, "cid": customer_id},
+    )).mappings().all()
+
+    return rows
+
+
+# --------- OVERVIEW DE CLIENTE (COMPUESTO) ---------
+
+async def get_customer_overview(db: AsyncSession, params: Dict[str, Any]) -> Dict[str, Any]:
     """
+    Paquete compuesto cliente + contactos + meetings en una sola llamada:
+    le ahorra al GPT la secuencia customers_search → customer_contacts →
+    meetings_by_customer (tres round-trips HTTP + BD por conversación).
+    Igual que el report data, los tres SELECT van en paralelo con
+    asyncio.gather sobre sesiones propias del pool.
+    """
+    customer_id = params.get("customerId")
+    if not customer_id:
+        raise HTTPException(
+            status_code=400,
+            detail="customerId es obligatorio para el overview",
+        )
 
-    rows = db.execute(
-        text(sql),
-        {"cid": customer_id},
-    ).mappings().all()
+    limit = int(params.get("limit", 50))
+
+    async def _with_own_session(fn):
+        async with AsyncSessionLocal() as s:
+            return await fn(s, {"customerId": customer_id, "limit": limit})
 
-    return [dict(r) for r in rows]
+    customer_row, contacts, meetings = await asyncio.gather(
+        db.execute(_SQL_CUSTOMER_HEADER, {"cid": customer_id}),
+        _with_own_session(get_customer_contacts),
+        _with_own_session(get_meetings_by_customer),
+    )
+    customer_row = customer_row.mappings().first()
+
+    if not customer_row:
+        raise HTTPException(status_code=404, detail="Customer not found")
+
+    return {
+        "customer": customer_row,
+        "contacts": contacts,
+        "meetings": meetings,
+    }
 
 
 # --------- MEETINGS POR CLIENTE ---------
 
 # --------- CREAR MEETING ---------
 
-def create_meeting(db: Session, params: Dict[str, Any]) -> Dict[str, Any]:
+async def create_meeting(db: AsyncSession, params: Dict[str, Any]) -> Dict[str, Any]:
     """
     Crea un registro en tblCustMeeting y devuelve el ID del meeting.
 
@@ -510,28 +1056,10 @@ def create_meeting(db: Session, params: Dict[str, Any]) -> Dict[str, Any]:
             detail="customerId y meetingDate son obligatorios para crear el meeting",
         )
 
-    sql = text("""
-        INSERT INTO tblCustMeeting (
-            fldCustomerID,
-            fldCustMeetingDate,
-            fldCreatedBy,
-            fldCreatedOn,
-            fldStatus,
-            fldAssetID
-        )
-        OUTPUT INSERTED.fldCustMeetingID AS NewMeetingID
-        VALUES (
-            :customer_id,
-            :meeting_date,
-            :created_by,
-            GETDATE(),
-            :status,
-            :asset_id
-        );
-    """)
+    sql = _SQL_CREATE_MEETING
 
     try:
-        row = db.execute(
+        new_meeting_id = (await db.execute(
             sql,
             {
                 "customer_id": customer_id,
@@ -540,21 +1068,13 @@ def create_meeting(db: Session, params: Dict[str, Any]) -> Dict[str, Any]:
                 "status": status,
                 "asset_id": asset_id,
             },
-        ).mappings().first()
+        )).scalar_one()
 
-        db.commit()
+        await db.commit()
     except SQLAlchemyError as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
 
-    if not row:
-        raise HTTPException(
-            status_code=500,
-            detail="No se pudo obtener el ID del meeting creado",
-        )
-
-    new_meeting_id = row["NewMeetingID"]
-
     return {
         "meetingId": new_meeting_id,
         "customerId": customer_id,
@@ -564,7 +1084,7 @@ def create_meeting(db: Session, params: Dict[str, Any]) -> Dict[str, Any]:
     }
 
 # --------- MEETINGS POR CLIENTE ---------
-def get_meetings_by_customer(db: Session, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+async def get_meetings_by_customer(db: AsyncSession, params: Dict[str, Any]) -> List[Dict[str, Any]]:
     customer_id = params.get("customerId")
     if not customer_id:
         raise HTTPException(
@@ -575,35 +1095,22 @@ def get_meetings_by_customer(db: Session, params: Dict[str, Any]) -> List[Dict[s
     limit = int(params.get("limit", 50))
     status = params.get("status")
 
-    sql = f"""
-        SELECT TOP ({limit})
-               fldCustMeetingID   AS meetingId,
-               fldCustomerID      AS customerId,
-               fldCustMeetingDate AS meetingDate,
-               fldCreatedBy       AS createdBy,
-               fldCreatedOn       AS createdOn,
-               fldStatus          AS status,
-               fldReportSentOn    AS reportSentOn,
-               fldAssetID         AS assetId
-        FROM tblCustMeeting
-        WHERE fldCustomerID = :cid
-    """
-
-    sql_params = {"cid": customer_id}
-
     if status:
-        sql += " AND fldStatus = :status"
-        sql_params["status"] = status
-
-    sql += " ORDER BY fldCustMeetingDate DESC, fldCustMeetingID DESC"
+        sql = _SQL_MEETINGS_BY_CUSTOMER_STATUS
+        sql_params = {"lim": limit, "cid": customer_id, "status": status}
+    else:
+        sql = _SQL_MEETINGS_BY_CUSTOMER
+        sql_params = {"lim": limit, "cid": customer_id}
 
-    rows = db.execute(text(sql), sql_params).mappings().all()
-    return [dict(r) for r in rows]
+    # RowMapping ya es dict-like: se devuelve tal cual, sin copiar fila
+    # a fila (el encoder de FastAPI lo serializa directo)
+    rows = (await db.execute(sql, sql_params)).mappings().all()
+    return rows
 
 
 # --------- DETALLES DE MEETING ---------
 
-def get_meeting_key_topics(db: Session, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+async def get_meeting_key_topics(db: AsyncSession, params: Dict[str, Any]) -> List[Dict[str, Any]]:
     meeting_id = params.get("meetingId")
     if not meeting_id:
         raise HTTPException(
@@ -611,19 +1118,12 @@ def get_meeting_key_topics(db: Session, params: Dict[str, Any]) -> List[Dict[str
             detail="meetingId es obligatorio para obtener los key topics",
         )
 
-    sql = """
-        SELECT *
-        FROM tblCustMeetingKeyTopic
-        WHERE fldCustMeetingID = :mid
-        ORDER BY fldCustMeetingKeyTopicID
-    """
-
-    rows = db.execute(text(sql), {"mid": meeting_id}).mappings().all()
-    return [dict(r) for r in rows]
+    rows = (await db.execute(_SQL_MEETING_KEY_TOPICS, {"mid": meeting_id})).mappings().all()
+    return rows
 
 # --------- CREAR KEY TOPIC ---------
 
-def create_meeting_key_topic(db: Session, params: Dict[str, Any]) -> Dict[str, Any]:
+async def create_meeting_key_topic(db: AsyncSession, params: Dict[str, Any]) -> Dict[str, Any]:
     """
     Crea un registro en tblCustMeetingKeyTopic.
 
@@ -645,26 +1145,10 @@ def create_meeting_key_topic(db: Session, params: Dict[str, Any]) -> Dict[str, A
             detail="meetingId y keyTopic son obligatorios para crear un key topic",
         )
 
-    sql = text("""
-        INSERT INTO tblCustMeetingKeyTopic (
-            fldCustMeetingID,
-            fldCustMeetingKeyTopic,
-            fldCustMeetingKeyTopicPos,
-            fldCreatedOn,
-            fldCreatedBy
-        )
-        OUTPUT INSERTED.fldCustMeetingKeyTopicID AS NewKeyTopicID
-        VALUES (
-            :meeting_id,
-            :key_topic,
-            :position,
-            GETDATE(),
-            :created_by
-        );
-    """)
+    sql = _SQL_CREATE_KEY_TOPIC
 
     try:
-        row = db.execute(
+        new_key_topic_id = (await db.execute(
             sql,
             {
                 "meeting_id": meeting_id,
@@ -672,29 +1156,23 @@ def create_meeting_key_topic(db: Session, params: Dict[str, Any]) -> Dict[str, A
                 "position": position,
                 "created_by": created_by,
             },
-        ).mappings().first()
+        )).scalar_one()
 
-        db.commit()
+        await db.commit()
 
     except SQLAlchemyError as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
 
-    if not row:
-        raise HTTPException(
-            status_code=500,
-            detail="No se pudo obtener el ID del key topic creado",
-        )
-
     return {
-        "keyTopicId": row["NewKeyTopicID"],
+        "keyTopicId": new_key_topic_id,
         "meetingId": meeting_id,
         "keyTopic": key_topic,
         "position": position,
         "createdBy": created_by,
     }
 
-def get_meeting_spec_ops(db: Session, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+async def get_meeting_spec_ops(db: AsyncSession, params: Dict[str, Any]) -> List[Dict[str, Any]]:
     meeting_id = params.get("meetingId")
     if not meeting_id:
         raise HTTPException(
@@ -702,19 +1180,12 @@ def get_meeting_spec_ops(db: Session, params: Dict[str, Any]) -> List[Dict[str,
             detail="meetingId es obligatorio para obtener los spec ops",
         )
 
-    sql = """
-        SELECT *
-        FROM tblCustMeetingSpecOp
-        WHERE fldCustMeetingID = :mid
-        ORDER BY fldCustMeetingSpecOpID
-    """
-
-    rows = db.execute(text(sql), {"mid": meeting_id}).mappings().all()
-    return [dict(r) for r in rows]
+    rows = (await db.execute(_SQL_MEETING_SPEC_OPS, {"mid": meeting_id})).mappings().all()
+    return rows
 
 # --------- CREAR SPEC OP ---------
 
-def create_meeting_spec_op(db: Session, params: Dict[str, Any]) -> Dict[str, Any]:
+async def create_meeting_spec_op(db: AsyncSession, params: Dict[str, Any]) -> Dict[str, Any]:
     """
     Crea un registro en tblCustMeetingSpecOp.
 
@@ -736,26 +1207,10 @@ def create_meeting_spec_op(db: Session, params: Dict[str, Any]) -> Dict[str, Any
             detail="meetingId y specOp son obligatorios para crear una spec op",
         )
 
-    sql = text("""
-        INSERT INTO tblCustMeetingSpecOp (
-            fldCustMeetingID,
-            fldCustMeetingSpecOp,
-            fldCustMeetingSpecOpPos,
-            fldCreatedBy,
-            fldCreatedOn
-        )
-        OUTPUT INSERTED.fldCustMeetingSpecOpID AS NewSpecOpID
-        VALUES (
-            :meeting_id,
-            :spec_op,
-            :position,
-            :created_by,
-            GETDATE()
-        );
-    """)
+    sql = _SQL_CREATE_SPEC_OP
 
     try:
-        row = db.execute(
+        new_spec_op_id = (await db.execute(
             sql,
             {
                 "meeting_id": meeting_id,
@@ -763,22 +1218,16 @@ def create_meeting_spec_op(db: Session, params: Dict[str, Any]) -> Dict[str, Any
                 "position": position,
                 "created_by": created_by,
             },
-        ).mappings().first()
+        )).scalar_one()
 
-        db.commit()
+        await db.commit()
 
     except SQLAlchemyError as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
 
-    if not row:
-        raise HTTPException(
-            status_code=500,
-            detail="No se pudo obtener el ID de la Spec Op creada",
-        )
-
     return {
-        "specOpId": row["NewSpecOpID"],
+        "specOpId": new_spec_op_id,
         "meetingId": meeting_id,
         "specOp": spec_op,
         "position": position,
@@ -786,7 +1235,7 @@ def create_meeting_spec_op(db: Session, params: Dict[str, Any]) -> Dict[str, Any
     }
 
 
-def get_meeting_actions(db: Session, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+async def get_meeting_actions(db: AsyncSession, params: Dict[str, Any]) -> List[Dict[str, Any]]:
     meeting_id = params.get("meetingId")
     if not meeting_id:
         raise HTTPException(
@@ -794,19 +1243,13 @@ def get_meeting_actions(db: Session, params: Dict[str, Any]) -> List[Dict[str, A
             detail="meetingId es obligatorio para obtener las action items",
         )
 
-    sql = """
-        SELECT *
-        FROM vwCustMeetingActionRespConcat
-        WHERE fldCustMeetingID = :mid
-    """
-
-    rows = db.execute(text(sql), {"mid": meeting_id}).mappings().all()
-    return [dict(r) for r in rows]
+    rows = (await db.execute(_SQL_MEETING_ACTIONS, {"mid": meeting_id})).mappings().all()
+    return rows
 
 
 # --------- CREAR ACTION ITEM ---------
 
-def create_meeting_action(db: Session, params: Dict[str, Any]) -> Dict[str, Any]:
+async def create_meeting_action(db: AsyncSession, params: Dict[str, Any]) -> Dict[str, Any]:
     """
     Crea una acción de meeting en tblCustMeetingAction + un responsable en tblCustMeetingActionResp (opcional).
 
@@ -834,112 +1277,50 @@ def create_meeting_action(db: Session, params: Dict[str, Any]) -> Dict[str, Any]
             detail="meetingId y description son obligatorios para crear una action",
         )
 
-    # 1️⃣ INSERT en tblCustMeetingAction (tu estructura real):
-    # fldCustMeetingActionID (IDENTITY PK)
-    # fldCustMeetingID
-    # fldCustMeetingAction
-    # fldCustMeetingActionPos
-    # fldCreatedBy
-    # fldCreatedOn
-    # fldStatus
-    sql_action = text("""
-        INSERT INTO tblCustMeetingAction (
-            fldCustMeetingID,
-            fldCustMeetingAction,
-            fldCustMeetingActionPos,
-            fldCreatedBy,
-            fldCreatedOn,
-            fldStatus
-        )
-        OUTPUT INSERTED.fldCustMeetingActionID AS NewActionID
-        VALUES (
-            :meeting_id,
-            :description,
-            :position,
-            :created_by,
-            GETDATE(),
-            :status
-        );
-    """)
+    # Un solo batch: el INSERT de la acción y el del responsable
+    # (opcional) viajan juntos y el id del padre se consume del lado
+    # del servidor, sin leerlo en Python entre medio
+    sql = _SQL_CREATE_ACTION
+
+    with_resp = branch is not None and employee_id is not None
 
     try:
-        action_row = db.execute(
-            sql_action,
+        row = (await db.execute(
+            sql,
             {
                 "meeting_id": meeting_id,
                 "description": description,
                 "position": position,
                 "created_by": created_by,
                 "status": status,
+                "with_resp": 1 if with_resp else 0,
+                "branch": branch,
+                "employee_id": employee_id,
+                "employee_id_b4": employee_id,
             },
-        ).mappings().first()
-
-        if not action_row:
-            db.rollback()
-            raise HTTPException(
-                status_code=500,
-                detail="No se pudo obtener el ID de la acción creada",
-            )
+        )).first()
 
-        new_action_id = action_row["NewActionID"]
-
-        # 2️⃣ INSERT en tblCustMeetingActionResp (responsable) si tenemos datos
-        # Estructura:
-        #   fldCustMeetingActionRespID (IDENTITY PK)
-        #   fldCustMeetingActionID
-        #   fldBranch
-        #   fldEmployeeID
-        #   fldCreatedBy
-        #   fldCreatedOn
-        #   fldEmployeeID_B4Merging
-        new_resp_id = None
-        if branch is not None and employee_id is not None:
-            sql_resp = text("""
-                INSERT INTO tblCustMeetingActionResp (
-                    fldCustMeetingActionID,
-                    fldBranch,
-                    fldEmployeeID,
-                    fldCreatedBy,
-                    fldCreatedOn,
-                    fldEmployeeID_B4Merging
-                )
-                OUTPUT INSERTED.fldCustMeetingActionRespID AS NewRespID
-                VALUES (
-                    :action_id,
-                    :branch,
-                    :employee_id,
-                    :created_by,
-                    GETDATE(),
-                    :employee_id_b4
-                );
-            """)
-
-            resp_row = db.execute(
-                sql_resp,
-                {
-                    "action_id": new_action_id,
-                    "branch": branch,
-                    "employee_id": employee_id,
-                    "created_by": created_by,
-                    "employee_id_b4": employee_id,
-                },
-            ).mappings().first()
-
-            if not resp_row:
-                db.rollback()
-                raise HTTPException(
-                    status_code=500,
-                    detail="La acción se creó pero no se pudo crear el responsable",
-                )
-
-            new_resp_id = resp_row["NewRespID"]
-
-        db.commit()
+        await db.commit()
 
     except SQLAlchemyError as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
 
+    if not row or row.NewActionID is None:
+        raise HTTPException(
+            status_code=500,
+            detail="No se pudo obtener el ID de la acción creada",
+        )
+
+    new_action_id = row.NewActionID
+    new_resp_id = row.NewRespID
+
+    if with_resp and new_resp_id is None:
+        raise HTTPException(
+            status_code=500,
+            detail="La acción se creó pero no se pudo crear el responsable",
+        )
+
     return {
         "actionId": new_action_id,
         "meetingId": meeting_id,
@@ -954,7 +1335,7 @@ def create_meeting_action(db: Session, params: Dict[str, Any]) -> Dict[str, Any]
 
 # --------- CREAR ASISTENTE ALATAS ---------
 
-def create_meeting_alatas_attendance(db: Session, params: Dict[str, Any]) -> Dict[str, Any]:
+async def create_meeting_alatas_attendance(db: AsyncSession, params: Dict[str, Any]) -> Dict[str, Any]:
     """
     Crea un asistente de Alatas para un meeting en tblCustMeetingAlatasAttendance.
 
@@ -974,26 +1355,10 @@ def create_meeting_alatas_attendance(db: Session, params: Dict[str, Any]) -> Dic
             detail="meetingId y employeeId son obligatorios para crear un asistente Alatas",
         )
 
-    sql = text("""
-        INSERT INTO tblCustMeetingAlatasAttendance (
-            fldCustMeetingID,
-            fldEmployeeID,
-            fldCreatedOn,
-            fldCreatedBy,
-            fldEmployeeID_B4Merging
-        )
-        OUTPUT INSERTED.fldCustMeetingAlatasAttendanceID AS NewAlatasAttendanceID
-        VALUES (
-            :meeting_id,
-            :employee_id,
-            GETDATE(),
-            :created_by,
-            :employee_id_b4
-        );
-    """)
+    sql = _SQL_CREATE_ALATAS_ATTENDANCE
 
     try:
-        row = db.execute(
+        new_attendance_id = (await db.execute(
             sql,
             {
                 "meeting_id": meeting_id,
@@ -1001,21 +1366,15 @@ def create_meeting_alatas_attendance(db: Session, params: Dict[str, Any]) -> Dic
                 "created_by": created_by,
                 "employee_id_b4": employee_id,
             },
-        ).mappings().first()
+        )).scalar_one()
 
-        db.commit()
+        await db.commit()
     except SQLAlchemyError as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
 
-    if not row:
-        raise HTTPException(
-            status_code=500,
-            detail="No se pudo obtener el ID del asistente Alatas creado",
-        )
-
     return {
-        "alatasAttendanceId": row["NewAlatasAttendanceID"],
+        "alatasAttendanceId": new_attendance_id,
         "meetingId": meeting_id,
         "employeeId": employee_id,
         "createdBy": created_by,
@@ -1023,7 +1382,7 @@ def create_meeting_alatas_attendance(db: Session, params: Dict[str, Any]) -> Dic
 
 # --------- CREAR ASISTENTE CLIENTE ---------
 
-def create_meeting_cust_attendance(db: Session, params: Dict[str, Any]) -> Dict[str, Any]:
+async def create_meeting_cust_attendance(db: AsyncSession, params: Dict[str, Any]) -> Dict[str, Any]:
     """
     Crea un asistente del cliente para un meeting en tblCustMeetingAttendance.
 
@@ -1043,53 +1402,80 @@ def create_meeting_cust_attendance(db: Session, params: Dict[str, Any]) -> Dict[
             detail="meetingId y contactId son obligatorios para crear un asistente cliente",
         )
 
-    sql = text("""
-        INSERT INTO tblCustMeetingAttendance (
-            fldCustMeetingID,
-            fldCustContactID,
-            fldCreatedOn,
-            fldCreatedBy
-        )
-        OUTPUT INSERTED.fldCustMeetingAttendanceID AS NewCustAttendanceID
-        VALUES (
-            :meeting_id,
-            :contact_id,
-            GETDATE(),
-            :created_by
-        );
-    """)
+    sql = _SQL_CREATE_CUST_ATTENDANCE
 
     try:
-        row = db.execute(
+        new_attendance_id = (await db.execute(
             sql,
             {
                 "meeting_id": meeting_id,
                 "contact_id": contact_id,
                 "created_by": created_by,
             },
-        ).mappings().first()
+        )).scalar_one()
 
-        db.commit()
+        await db.commit()
     except SQLAlchemyError as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
 
-    if not row:
+    return {
+        "custAttendanceId": new_attendance_id,
+        "meetingId": meeting_id,
+        "contactId": contact_id,
+        "createdBy": created_by,
+    }
+
+# --------- CREAR ASISTENTES CLIENTE EN BLOQUE ---------
+
+async def create_meeting_cust_attendance_bulk(db: AsyncSession, params: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Registra varios asistentes del cliente para un meeting en un solo
+    executemany (fast_executemany arma el batch a nivel de driver) y un
+    solo commit, en vez de un INSERT + round trip por asistente.
+
+    Parámetros esperados:
+      - meetingId (int)        → obligatorio
+      - contactIds (list[int]) → obligatorio, IDs de fldCustContactID
+      - createdBy (str)        → opcional, por defecto 'GPT_API'
+    """
+
+    meeting_id = params.get("meetingId")
+    contact_ids = params.get("contactIds")
+    created_by = params.get("createdBy") or "GPT_API"
+
+    if not meeting_id or not contact_ids:
         raise HTTPException(
-            status_code=500,
-            detail="No se pudo obtener el ID del asistente cliente creado",
+            status_code=400,
+            detail="meetingId y contactIds (lista no vacía) son obligatorios",
         )
 
+    params_list = [
+        {
+            "meeting_id": meeting_id,
+            "contact_id": contact_id,
+            "created_by": created_by,
+        }
+        for contact_id in contact_ids
+    ]
+
+    try:
+        # Lista de dicts → executemany a nivel de driver, una transacción
+        await db.execute(_SQL_CREATE_CUST_ATTENDANCE_BULK, params_list)
+        await db.commit()
+    except SQLAlchemyError as e:
+        await db.rollback()
+        raise HTTPException(status_code=500, detail=str(e))
+
     return {
-        "custAttendanceId": row["NewCustAttendanceID"],
         "meetingId": meeting_id,
-        "contactId": contact_id,
+        "attendeesCreated": len(params_list),
         "createdBy": created_by,
     }
 
 # --------- MEETING REPORT DATA (HÍBRIDO) ---------
 
-def get_meeting_report_data(db: Session, meeting_id: int) -> Dict[str, Any]:
+async def get_meeting_report_data(db: AsyncSession, meeting_id: int) -> Dict[str, Any]:
     """
     Devuelve un paquete estructurado con toda la info necesaria
     para que GPT redacte un Meeting Report:
@@ -1100,43 +1486,31 @@ def get_meeting_report_data(db: Session, meeting_id: int) -> Dict[str, Any]:
       - actions: resumen de action items
     """
 
-    # 1️⃣ Cabecera del meeting (con customer y asset info si se puede)
-    header_sql = text("""
-        SELECT TOP (1)
-               m.fldCustMeetingID   AS meetingId,
-               m.fldCustomerID      AS customerId,
-               c.fldCustomerName    AS customerName,
-               m.fldCustMeetingDate AS meetingDate,
-               m.fldCreatedBy       AS createdBy,
-               m.fldCreatedOn       AS createdOn,
-               m.fldStatus          AS status,
-               m.fldReportSentOn    AS reportSentOn,
-               m.fldAssetID         AS assetId,
-               a.fldVName           AS vesselName,
-               a.fldAssetIdentifier AS assetIdentifier,
-               a.fldAssetType       AS assetType
-        FROM tblCustMeeting m
-        LEFT JOIN tblCustomer c
-               ON c.fldCustomerID = m.fldCustomerID
-        LEFT JOIN vwCustomerAssetAffiliation a
-               ON a.fldAssetID = m.fldAssetID
-        WHERE m.fldCustMeetingID = :mid
-    """)
-
-    header_row = db.execute(header_sql, {"mid": meeting_id}).mappings().first()
+    # 2️⃣ Cabecera + key topics + special ops + actions en paralelo: los
+    # cuatro SELECT son independientes y cada uno usa su propia sesión
+    # del pool (una AsyncSession no admite ejecuciones concurrentes), así
+    # la latencia es la del SELECT más lento y no la suma de los cuatro.
+    # (Se evaluó empaquetar los cuatro en un solo batch T-SQL y recorrer
+    # los result sets con cursor.nextset(): un solo round-trip, pero el
+    # stack async de SQLAlchemy sobre aioodbc no expone nextset() en el
+    # Result, así que el gather es la variante equivalente aquí.)
+    async def _with_own_session(fn):
+        async with AsyncSessionLocal() as s:
+            return await fn(s, {"meetingId": meeting_id})
+
+    header_row, key_topics, spec_ops, actions = await asyncio.gather(
+        db.execute(_SQL_MEETING_REPORT_HEADER, {"mid": meeting_id}),
+        _with_own_session(get_meeting_key_topics),
+        _with_own_session(get_meeting_spec_ops),
+        _with_own_session(get_meeting_actions),
+    )
+    header_row = header_row.mappings().first()
 
     if not header_row:
         raise HTTPException(status_code=404, detail="Meeting not found")
 
-    meeting_header = dict(header_row)
-
-    # 2️⃣ Key topics, special ops, actions reutilizando tus funciones existentes
-    key_topics = get_meeting_key_topics(db, {"meetingId": meeting_id})
-    spec_ops   = get_meeting_spec_ops(db, {"meetingId": meeting_id})
-    actions    = get_meeting_actions(db, {"meetingId": meeting_id})
-
     return {
-        "meeting": meeting_header,
+        "meeting": header_row,
         "keyTopics": key_topics,
         "specialOps": spec_ops,
         "actions": actions,
@@ -1145,7 +1519,7 @@ def get_meeting_report_data(db: Session, meeting_id: int) -> Dict[str, Any]:
 
 # --------- CREAR COTIZACIÓN ---------
 
-def create_quote_from_asset(db: Session, params: Dict[str, Any]) -> Dict[str, Any]:
+async def create_quote_from_asset(db: AsyncSession, params: Dict[str, Any]) -> Dict[str, Any]:
     customer_id = params.get("customerId")
     asset_id = params.get("assetId")
 
@@ -1160,24 +1534,10 @@ def create_quote_from_asset(db: Session, params: Dict[str, Any]) -> Dict[str, An
     relationship_id = params.get("relationshipId")
     notes = params.get("notes")
 
-    sql = text("""
-        DECLARE @NewQuoteID INT, @NewQuoteNo NVARCHAR(50);
-
-        EXEC dbo.uspCreateQuoteAPI
-            @CustomerID     = :customer_id,
-            @AssetID        = :asset_id,
-            @Branch         = :branch,
-            @CreatedBy      = :created_by,
-            @RelationshipID = :relationship_id,
-            @Notes          = :notes,
-            @NewQuoteID     = @NewQuoteID OUTPUT,
-            @NewQuoteNo     = @NewQuoteNo OUTPUT;
-
-        SELECT @NewQuoteID AS NewQuoteID, @NewQuoteNo AS NewQuoteNo;
-    """)
+    sql = _SQL_CREATE_QUOTE
 
     try:
-        row = db.execute(
+        row = (await db.execute(
             sql,
             {
                 "customer_id": customer_id,
@@ -1187,11 +1547,11 @@ def create_quote_from_asset(db: Session, params: Dict[str, Any]) -> Dict[str, An
                 "relationship_id": relationship_id,
                 "notes": notes,
             },
-        ).mappings().first()
+        )).first()
 
-        db.commit()
+        await db.commit()
     except SQLAlchemyError as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
 
     if not row:
@@ -1200,16 +1560,55 @@ def create_quote_from_asset(db: Session, params: Dict[str, Any]) -> Dict[str, An
             detail="No se pudo obtener el resultado de la creación de la cotización",
         )
 
+    # La cotización nueva cambia los agregados de su branch: se tiran
+    # las entradas cacheadas de ese branch (todas si no vino branch)
+    for key in list(_quotes_count_cache):
+        if branch is None or key[0] == branch:
+            _quotes_count_cache.pop(key, None)
+
     return {
-        "quoteId": row["NewQuoteID"],
-        "quoteNo": row["NewQuoteNo"],
+        "quoteId": row.NewQuoteID,
+        "quoteNo": row.NewQuoteNo,
         "customerId": customer_id,
         "assetId": asset_id,
         "branch": branch,
     }
 
 
+# --------- DISPATCH ---------
+# Un lookup de hash por request en vez de la escalera if/elif.
+# Cada entrada es (handler, cacheable): la metadata de cacheo vive junto
+# al handler en vez de en un set paralelo que haya que mantener a mano
+
+HANDLERS = {
+    "customers_search": (search_customers, True),
+    "quotes_by_customer": (get_quotes_by_customer, True),
+    # quotes_count usa su cache propio con invalidación (ver helper)
+    "quotes_count_by_branch_status": (get_quotes_count_by_branch_status, False),
+    "assets_by_customer": (get_assets_by_customer, True),
+    "assets_search_global": (search_assets_global, True),
+    "create_quote_from_asset": (create_quote_from_asset, False),
+    "customer_contacts": (get_customer_contacts, True),
+    "customer_overview": (get_customer_overview, True),
+    # -------- MEETINGS --------
+    "meetings_by_customer": (get_meetings_by_customer, True),
+    "meeting_key_topics": (get_meeting_key_topics, True),
+    "meeting_spec_ops": (get_meeting_spec_ops, True),
+    "meeting_actions": (get_meeting_actions, True),
+    "create_meeting": (create_meeting, False),
+    "create_meeting_key_topic": (create_meeting_key_topic, False),
+    "create_meeting_spec_op": (create_meeting_spec_op, False),
+    "create_meeting_action": (create_meeting_action, False),
+    "create_meeting_alatas_attendance": (create_meeting_alatas_attendance, False),
+    "create_meeting_cust_attendance": (create_meeting_cust_attendance, False),
+    "create_meeting_cust_attendance_bulk": (create_meeting_cust_attendance_bulk, False),
+}
+
+
 # ---------------------------
 # 👉 INCLUIR EL NUEVO ROUTER
 # ---------------------------
 app.include_router(email_router.router)
+
+# Métricas Prometheus (incluye las del pool de DB definidas en database.py)
+app.mount("/metrics", make_asgi_app())
@@ -0,0 +1,11 @@
+-- Índice único sobre InternetMessageID: soporta el upsert (MERGE) de
+-- /email/track y garantiza un solo registro por correo procesado.
+IF NOT EXISTS (
+    SELECT 1 FROM sys.indexes
+    WHERE name = 'ix_emailquotetracking_imid'
+      AND object_id = OBJECT_ID('tblEmailQuoteTracking')
+)
+BEGIN
+    CREATE UNIQUE INDEX ix_emailquotetracking_imid
+        ON tblEmailQuoteTracking (InternetMessageID);
+END;
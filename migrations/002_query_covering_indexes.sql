@@ -0,0 +1,31 @@
+-- Índices cubrientes para los caminos calientes de /api/query:
+--   * quotes_count_by_branch_status filtra vwGlobalQuotes por
+--     Branch + fldQStatus y agrega fldUSDValue
+--   * assets_by_customer filtra vwCustomerAssetAffiliation por
+--     fldCustomerID / fldVName
+-- Los índices van sobre las tablas base de las vistas (aquí se asumen
+-- tblQuote y tblAsset; confirmar contra la definición real de cada
+-- vista antes de aplicar en producción). Con ellos, los scans se
+-- vuelven seeks y el COUNT/SUM de quotes_count lee solo el índice.
+
+IF NOT EXISTS (
+    SELECT 1 FROM sys.indexes
+    WHERE name = 'ix_quote_branch_status'
+      AND object_id = OBJECT_ID('tblQuote')
+)
+BEGIN
+    CREATE INDEX ix_quote_branch_status
+        ON tblQuote (Branch, fldQStatus)
+        INCLUDE (fldUSDValue, fldQCreatedDate, fldCustomerID, fldQuoteNo);
+END;
+
+IF NOT EXISTS (
+    SELECT 1 FROM sys.indexes
+    WHERE name = 'ix_asset_customer_vname'
+      AND object_id = OBJECT_ID('tblAsset')
+)
+BEGIN
+    CREATE INDEX ix_asset_customer_vname
+        ON tblAsset (fldCustomerID, fldVName)
+        INCLUDE (fldAssetType, fldAssetTypeID, fldAssetIdentifier);
+END;
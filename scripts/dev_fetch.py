@@ -0,0 +1,42 @@
+# scripts/dev_fetch.py
+#
+# Prueba manual del fetch de correos contra Graph (antes vivía como
+# bloque __main__ dentro de graph_client.py).
+#
+# Uso (desde el directorio que contiene el paquete app/):
+#   python -m scripts.dev_fetch
+
+import asyncio
+
+from app.graph_client import fetch_recent_messages, close_client
+
+
+async def main():
+    print("\nTesting email fetch...\n")
+
+    try:
+        msgs = await fetch_recent_messages(5)
+        print(f"Fetched {len(msgs)} messages.\n")
+
+        for i, m in enumerate(msgs, start=1):
+            print(f"--- Message {i} ---")
+            print(f"ID: {m['id']}")
+            print(f"InternetMessageID: {m.get('internetMessageId')}")
+            print(f"InReplyTo: {m.get('inReplyTo')}")
+            print(f"From: {m['from']}")
+            print(f"To: {', '.join(m['to'])}")
+            print(f"Subject: {m['subject']}")
+            snippet = (m['body'] or "").replace("\n", " ")[:200]
+            print(f"Body snippet: {snippet!r}")
+            print()
+
+    except Exception as err:
+        print("❌ ERROR while fetching messages:")
+        print(err)
+
+    finally:
+        await close_client()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())